@@ -0,0 +1,70 @@
+# bench_records.py
+"""
+Compare le coût (temps et mémoire) de la lecture de lignes d'inventaire:
+dict(zip(colonnes, ligne)) sur sqlite3.Row (ancienne méthode) contre InventoryRecord (__slots__).
+
+Usage:
+    python bench_records.py [--rows 100000]
+"""
+import os
+# Empêcher Kivy d'interpréter les arguments de la ligne de commande
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+
+import db_manager
+
+def _create_database(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE inventory ({', '.join(db_manager.INVENTORY_COLUMNS)})")
+    conn.executemany(
+        f"INSERT INTO inventory VALUES ({', '.join('?' * len(db_manager.INVENTORY_COLUMNS))})",
+        ((i, f'PAL{i:07d}', f'Produit {i % 500}', 12.5, '2027-01-31', f'LOT{i % 2000}', 24,
+          f'A{i % 90}{i % 7}', '2025-01-01 08:00:00') for i in range(rows)))
+    return conn
+
+def _load_dicts(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("SELECT * FROM inventory")
+    records = cursor.fetchall()
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, record)) for record in records]
+
+def _load_records(conn):
+    cursor = db_manager._inventory_cursor(conn)
+    cursor.execute(f"SELECT {db_manager.INVENTORY_SELECT} FROM inventory")
+    return cursor.fetchall()
+
+def _measure(label, loader, conn):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = loader(conn)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Vérifier l'accès utilisé par main.py
+    assert records[-1].get('location_id', 'N/A') is not None
+    print(f"{label:<28} {elapsed * 1000:8.1f} ms  conservé {current / 1e6:7.1f} Mo  pic {peak / 1e6:7.1f} Mo")
+    del records
+    return elapsed, current
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dict(zip()) contre InventoryRecord.")
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    conn = _create_database(args.rows)
+    print(f"{args.rows} ligne(s):")
+    dict_time, dict_memory = _measure("dict(zip(colonnes, ligne))", _load_dicts, conn)
+    record_time, record_memory = _measure("InventoryRecord (__slots__)", _load_records, conn)
+    print(f"Gain: {(dict_time - record_time) * 1000:.1f} ms, {(dict_memory - record_memory) / 1e6:.1f} Mo "
+          f"pour {args.rows} ligne(s)")
+
+if __name__ == '__main__':
+    main()
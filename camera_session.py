@@ -0,0 +1,133 @@
+# camera_session.py
+import platform
+import threading
+import time
+from kivy.logger import Logger # Importer Logger
+
+CAMERA_INDICES = (0, 1) # Caméra avant (souvent index 0), puis la suivante
+CAMERA_IDLE_TIMEOUT = 30 # secondes sans scan avant de fermer la caméra (0 = fermer après chaque scan)
+READ_RETRIES = 1 # Réouvertures de la caméra après un échec de lecture
+
+class CameraSession:
+    """
+    Caméra (cv2.VideoCapture) gardée ouverte entre deux scans: un scan produit suivi du scan
+    emplacement ne repaie pas l'ouverture de la caméra. Fermée après idle_timeout secondes
+    sans utilisation. L'index qui a fonctionné est essayé en premier aux ouvertures suivantes.
+    Utilisation (un seul utilisateur à la fois):
+        with session:
+            error = session.open()
+            frame, error = session.read()
+    """
+    live = True # Images produites au rythme de la caméra (voir frame_sources)
+
+    def __init__(self, camera_index=None, camera_indices=CAMERA_INDICES, idle_timeout=CAMERA_IDLE_TIMEOUT):
+        self.camera_index = camera_index # Dernier index ouvert avec succès
+        self.camera_indices = camera_indices
+        self.idle_timeout = idle_timeout
+        self._lock = threading.RLock()
+        self._capture = None
+        self._idle_timer = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.idle_timeout and self._capture is not None:
+                self._idle_timer = threading.Timer(self.idle_timeout, self._close_if_idle)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+            else:
+                self.close()
+        finally:
+            self._lock.release()
+
+    def is_open(self):
+        return self._capture is not None
+
+    def _candidate_indices(self):
+        if self.camera_index is None:
+            return list(self.camera_indices)
+        return [self.camera_index] + [index for index in self.camera_indices if index != self.camera_index]
+
+    def open(self):
+        """Ouvre la caméra si nécessaire. Retourne None ou un message d'erreur."""
+        with self._lock:
+            if self._capture is not None:
+                return None
+            import cv2
+            # CAP_DSHOW n'existe que sous Windows (ouverture plus rapide qu'avec MSMF)
+            backend = cv2.CAP_DSHOW if platform.system() == "Windows" else cv2.CAP_ANY
+            start_time = time.perf_counter()
+            for index in self._candidate_indices():
+                Logger.info(f"SCANNER: Tentative d'ouverture de la caméra index {index}...")
+                capture = cv2.VideoCapture(index, backend)
+                if capture is not None and capture.isOpened():
+                    self._capture = capture
+                    if index != self.camera_index:
+                        Logger.info(f"SCANNER: Caméra index {index} retenue pour les prochains scans.")
+                    self.camera_index = index
+                    Logger.info(f"SCANNER: Caméra index {index} ouverte en {(time.perf_counter() - start_time) * 1000:.0f} ms.")
+                    return None
+                if capture is not None:
+                    capture.release()
+                Logger.warning(f"SCANNER: Échec ouverture caméra index {index}.")
+            Logger.error(f"SCANNER: Impossible d'ouvrir les caméras index {', '.join(map(str, self.camera_indices))}.")
+            return "Caméra inaccessible"
+
+    def read(self):
+        """
+        Lit une image. En cas d'échec (caméra débranchée, mise en veille...), la caméra est
+        rouverte puis la lecture réessayée. Retourne (image, None) ou (None, message d'erreur).
+        """
+        with self._lock:
+            for attempt in range(READ_RETRIES + 1):
+                if self._capture is None:
+                    error = self.open()
+                    if error:
+                        return None, error
+                ret, frame = self._capture.read()
+                if ret:
+                    return frame, None
+                Logger.warning(f"SCANNER: Échec de lecture de la caméra index {self.camera_index}, réouverture...")
+                self.close()
+            return None, "Erreur de lecture de la caméra"
+
+    def close(self):
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self._capture is not None:
+                self._capture.release()
+                self._capture = None
+                Logger.info("SCANNER: Caméra fermée.")
+
+    def _close_if_idle(self):
+        # Appelé par le minuteur: ne pas fermer si un scan a repris entre-temps
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._idle_timer is not None and self._idle_timer is threading.current_thread():
+                self._idle_timer = None
+                Logger.info(f"SCANNER: Caméra inutilisée depuis {self.idle_timeout}s.")
+                self.close()
+        finally:
+            self._lock.release()
+
+_session = CameraSession()
+
+def get_camera_session():
+    return _session
+
+def configure_camera(camera_index=None, idle_timeout=CAMERA_IDLE_TIMEOUT):
+    """Index de caméra mémorisé (None = essayer CAMERA_INDICES dans l'ordre) et délai de fermeture."""
+    _session.camera_index = camera_index
+    _session.idle_timeout = idle_timeout
+
+def close_camera():
+    _session.close()
@@ -1,12 +1,24 @@
 # db_manager.py
 import sqlite3
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from kivy.app import App # Pour obtenir le chemin user_data_dir
 from kivy.logger import Logger # Importer Logger
 
 DATABASE_NAME = 'database.db'
 
+# Réglages du gestionnaire de connexions
+BUSY_TIMEOUT_MS = 5000 # Attente max (ms) quand un autre processus tient le verrou d'écriture
+READER_POOL_SIZE = 2 # Nombre de connexions de lecture conservées ouvertes
+WRITE_RETRIES = 5 # Tentatives supplémentaires si la DB reste verrouillée malgré busy_timeout
+RETRY_BACKOFF = 0.05 # Délai initial (s) entre deux tentatives, doublé à chaque échec
+STATEMENT_CACHE_SIZE = 128 # Requêtes préparées conservées par connexion (cache sqlite3)
+
 def get_db_path():
     """Retourne le chemin complet vers le fichier de base de données."""
     # Stocke la DB dans un endroit accessible en écriture sur toutes les plateformes
@@ -33,199 +45,697 @@ def normalize_location_id(location_id):
     # Supprimer les points et les espaces superflus
     return location_id.replace('.', '').strip()
 
-def init_db():
-    """Initialise la base de données et crée la table si elle n'existe pas."""
-    db_path = get_db_path()
-    Logger.info(f"DB: Tentative d'initialisation de la base de données à: {db_path}")
-    conn = None # Initialiser conn à None
+# --- Enregistrements d'inventaire ---
+# Les lignes de la table inventory sont retournées sous forme d'InventoryRecord (__slots__)
+# au lieu de dict(zip(colonnes, ligne)): pas de liste de colonnes ni de dict par ligne.
+
+INVENTORY_COLUMNS = ('id', 'palette_number', 'product_name', 'price', 'expiry_date',
+                     'lot_number', 'boxes_per_package', 'location_id', 'timestamp')
+_INVENTORY_COLUMN_SET = frozenset(INVENTORY_COLUMNS)
+# Liste de colonnes explicite (ordre de INVENTORY_COLUMNS) pour les SELECT lus par inventory_row_factory
+INVENTORY_SELECT = ', '.join(f'inventory.{column}' for column in INVENTORY_COLUMNS)
+
+class InventoryRecord:
+    """
+    Ligne de la table inventory. Compatible avec l'ancien usage en dict:
+    record['lot_number'], record.get('location_id', 'N/A'), record['timestamp'] = ..., dict(record).
+    """
+    __slots__ = INVENTORY_COLUMNS
+
+    def __init__(self, id, palette_number, product_name, price, expiry_date,
+                 lot_number, boxes_per_package, location_id, timestamp):
+        self.id = id
+        self.palette_number = palette_number
+        self.product_name = product_name
+        self.price = price
+        self.expiry_date = expiry_date
+        self.lot_number = lot_number
+        self.boxes_per_package = boxes_per_package
+        self.location_id = location_id
+        self.timestamp = timestamp
+
+    def __getitem__(self, key):
+        if key not in _INVENTORY_COLUMN_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in _INVENTORY_COLUMN_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        if key not in _INVENTORY_COLUMN_SET:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in _INVENTORY_COLUMN_SET
+
+    def __iter__(self):
+        return iter(INVENTORY_COLUMNS)
+
+    def __len__(self):
+        return len(INVENTORY_COLUMNS)
+
+    def keys(self):
+        return INVENTORY_COLUMNS
+
+    def values(self):
+        return [getattr(self, column) for column in INVENTORY_COLUMNS]
+
+    def items(self):
+        return [(column, getattr(self, column)) for column in INVENTORY_COLUMNS]
+
+    def copy(self):
+        return InventoryRecord(*self.values())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, InventoryRecord):
+            return self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"InventoryRecord({self.to_dict()!r})"
+
+def inventory_row_factory(cursor, row):
+    """row_factory de curseur pour les requêtes SELECT {INVENTORY_SELECT} ..."""
+    return InventoryRecord(*row)
+
+def _inventory_cursor(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = inventory_row_factory
+    return cursor
+
+# --- Gestionnaire de connexions ---
+# Une connexion d'écriture unique (protégée par un verrou) et un petit pool de
+# connexions de lecture réutilisées. Les connexions restent ouvertes pendant toute
+# la durée de l'application : plus de sqlite3.connect / get_db_path / os.makedirs
+# à chaque requête, et le cache de requêtes préparées de sqlite3 devient efficace.
+
+def _is_locked_error(error):
+    """Indique si une OperationalError correspond à une base verrouillée/occupée."""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+class ConnectionManager:
+    """Gère les connexions persistantes (1 écrivain + N lecteurs) vers la base SQLite."""
+
+    def __init__(self, db_path, reader_pool_size=READER_POOL_SIZE, busy_timeout_ms=BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue(maxsize=reader_pool_size)
+        self._borrowed = {} # Connexions de lecture prêtées -> thread emprunteur (pour interrupt_reads)
+        self._closed = False
+
+    def connect(self):
+        """Ouvre une nouvelle connexion configurée (WAL, busy timeout, cache de requêtes)."""
+        # isolation_level=None: les transactions sont gérées explicitement (BEGIN IMMEDIATE)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            isolation_level=None,
+            check_same_thread=False, # Connexions partagées entre threads, accès sérialisé par le gestionnaire
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        # Utiliser Row pour accéder aux colonnes par nom
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            # Certains systèmes de fichiers (partages réseau) ne supportent pas WAL
+            Logger.warning(f"DB: Mode WAL indisponible, journal_mode={journal_mode}.")
+        conn.execute("PRAGMA synchronous = NORMAL") # Suffisant en WAL, beaucoup moins de fsync
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _get_writer(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Gestionnaire de connexions fermé.")
+        if self._writer is None:
+            self._writer = self.connect()
+        return self._writer
+
+    def _run_with_retry(self, func):
+        """Exécute func() en réessayant avec un délai croissant si la base est verrouillée."""
+        delay = RETRY_BACKOFF
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                return func()
+            except sqlite3.OperationalError as e:
+                if not _is_locked_error(e) or attempt == WRITE_RETRIES:
+                    raise
+                Logger.warning(f"DB: Base verrouillée ({e}), nouvelle tentative dans {delay:.2f}s...")
+                time.sleep(delay)
+                delay *= 2
+
+    @contextmanager
+    def transaction(self):
+        """
+        Ouvre une transaction d'écriture (BEGIN IMMEDIATE) sur la connexion d'écriture.
+        COMMIT en sortie normale, ROLLBACK si une exception est levée (puis propagée).
+        Les appels imbriqués réutilisent la transaction en cours.
+        """
+        with self._write_lock:
+            conn = self._get_writer()
+            if conn.in_transaction:
+                # Transaction déjà ouverte par l'appelant (même thread): la réutiliser
+                yield conn
+                return
+            self._run_with_retry(lambda: conn.execute("BEGIN IMMEDIATE"))
+            try:
+                yield conn
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            try:
+                self._run_with_retry(conn.commit)
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Prête une connexion de lecture du pool (ouverte si nécessaire) et la rend ensuite."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Gestionnaire de connexions fermé.")
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        self._borrowed[conn] = threading.get_ident()
+        try:
+            yield conn
+        finally:
+            self._borrowed.pop(conn, None)
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                try:
+                    self._readers.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+
+    def interrupt_reads(self, thread_ident=None):
+        """
+        Interrompt les lectures en cours (la requête lève OperationalError 'interrupted'):
+        seulement celles du thread thread_ident si indiqué, sinon toutes.
+        """
+        for conn, borrower in list(self._borrowed.items()):
+            if thread_ident is None or borrower == thread_ident:
+                conn.interrupt()
+
+    def close(self):
+        """Ferme toutes les connexions (à appeler à l'arrêt de l'application)."""
+        self._closed = True
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_connection_manager():
+    """Retourne le gestionnaire de connexions du module (créé au premier appel)."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager(get_db_path())
+                Logger.info(f"DB: Gestionnaire de connexions créé pour {_manager.db_path}")
+    return _manager
+
+def close_db():
+    """Ferme les connexions persistantes. Un appel ultérieur en rouvrira de nouvelles."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+            _lookup_cache.clear()
+            Logger.info("DB: Connexions fermées.")
+
+def open_db(db_path):
+    """Utilise la base db_path au lieu de get_db_path() (scripts hors application Kivy)."""
+    global _manager
+    close_db()
+    with _manager_lock:
+        _manager = ConnectionManager(db_path)
+    Logger.info(f"DB: Base de données utilisée: {db_path}")
+
+def interrupt_reads(thread_ident=None):
+    """
+    Interrompt les lectures en cours (ex: recherche devenue inutile), seulement celles du thread
+    thread_ident si indiqué: un export sur son propre thread n'est pas touché par l'annulation
+    d'une recherche. Les écritures ne sont jamais interrompues.
+    """
+    if _manager is not None:
+        _manager.interrupt_reads(thread_ident)
+
+def read_connection():
+    """Context manager: `with read_connection() as conn:` pour les requêtes de lecture."""
+    return get_connection_manager().reader()
+
+def write_transaction():
+    """Context manager: `with write_transaction() as conn:` pour une transaction d'écriture."""
+    return get_connection_manager().transaction()
+
+# --- Occupation des emplacements ---
+# Un emplacement ne peut contenir qu'une palette: index unique partiel sur location_id
+# (créé par init_db si aucun doublon n'existe). "Cet emplacement est-il libre ?" est une
+# recherche ponctuelle dans cet index, faite dans la transaction d'écriture (commit_scan).
+
+def _find_location_conflicts(conn):
+    """Retourne {location_id: [palettes]} pour les emplacements occupés par plusieurs palettes."""
+    conflicts = {}
+    rows = conn.execute('''
+        SELECT location_id, palette_number FROM inventory
+        WHERE location_id IN (
+            SELECT location_id FROM inventory
+            WHERE location_id IS NOT NULL
+            GROUP BY location_id HAVING COUNT(*) > 1
+        )
+        ORDER BY location_id, palette_number
+    ''')
+    for location_id, palette_number in rows:
+        conflicts.setdefault(location_id, []).append(palette_number)
+    return conflicts
+
+def find_location_conflicts():
+    """Rapport des emplacements partagés par plusieurs palettes (à corriger avant l'index unique)."""
+    try:
+        with read_connection() as conn:
+            return _find_location_conflicts(conn)
+    except sqlite3.Error as e:
+        Logger.error(f"DB: Erreur lors de la recherche des doublons d'emplacement: {e}")
+        return {}
+
+def _migrate_location_index(cursor):
+    """Crée l'index unique partiel sur location_id, ou un index simple si des doublons existent."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_location_unique'")
+    if cursor.fetchone():
+        return # Déjà migré: l'index garantit l'absence de doublons
+    conflicts = _find_location_conflicts(cursor.connection)
+    if conflicts:
+        for location_id, palettes in conflicts.items():
+            Logger.error(f"DB: Emplacement {location_id} occupé par plusieurs palettes: {', '.join(palettes)}")
+        # Index non unique en attendant la correction, pour garder des recherches indexées
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_location_lookup ON inventory (location_id)')
+        Logger.warning(f"DB: {len(conflicts)} emplacement(s) en double. Index d'unicité non créé, "
+                       "corrigez les doublons puis relancez l'application.")
+    else:
+        cursor.execute('DROP INDEX IF EXISTS idx_location_lookup')
+        cursor.execute('CREATE UNIQUE INDEX idx_location_unique ON inventory (location_id) WHERE location_id IS NOT NULL')
+        Logger.info("DB: Index d'unicité des emplacements créé.")
+
+# --- Journal des mouvements ---
+# Table append-only alimentée par triggers: chaque ADD/MOVE/DELETE sur inventory y est
+# inscrit dans la même transaction, quel que soit le code (ou l'appareil) qui écrit.
+# seq (AUTOINCREMENT) est strictement croissant et jamais réutilisé.
+
+MOVEMENT_COLUMNS = ('seq', 'action', 'inventory_id', 'palette_number', 'product_name', 'price',
+                    'expiry_date', 'lot_number', 'boxes_per_package', 'from_location', 'location_id', 'timestamp')
+_MOVEMENT_SELECT = ', '.join(MOVEMENT_COLUMNS)
+# Même format que les timestamps de l'application (datetime.now().strftime)
+_SQL_NOW = "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')"
+
+def _init_movements(cursor):
+    """Crée la table movements, ses index et les triggers qui l'alimentent."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movements (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT NOT NULL, -- ADD, MOVE ou DELETE
+            inventory_id INTEGER,
+            palette_number TEXT NOT NULL,
+            product_name TEXT,
+            price REAL,
+            expiry_date TEXT,
+            lot_number TEXT,
+            boxes_per_package INTEGER,
+            from_location TEXT,
+            location_id TEXT,
+            timestamp TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movements_palette ON movements (palette_number, seq)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movements_lot ON movements (lot_number, seq)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movements_timestamp ON movements (timestamp)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movements_add AFTER INSERT ON inventory BEGIN
+            INSERT INTO movements (action, inventory_id, palette_number, product_name, price, expiry_date,
+                                   lot_number, boxes_per_package, from_location, location_id, timestamp)
+            VALUES ('ADD', new.id, new.palette_number, new.product_name, new.price, new.expiry_date,
+                    new.lot_number, new.boxes_per_package, NULL, new.location_id, new.timestamp);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movements_move AFTER UPDATE OF location_id ON inventory
+        WHEN old.location_id IS NOT new.location_id BEGIN
+            INSERT INTO movements (action, inventory_id, palette_number, product_name, price, expiry_date,
+                                   lot_number, boxes_per_package, from_location, location_id, timestamp)
+            VALUES ('MOVE', new.id, new.palette_number, new.product_name, new.price, new.expiry_date,
+                    new.lot_number, new.boxes_per_package, old.location_id, new.location_id, new.timestamp);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movements_delete AFTER DELETE ON inventory BEGIN
+            INSERT INTO movements (action, inventory_id, palette_number, product_name, price, expiry_date,
+                                   lot_number, boxes_per_package, from_location, location_id, timestamp)
+            VALUES ('DELETE', old.id, old.palette_number, old.product_name, old.price, old.expiry_date,
+                    old.lot_number, old.boxes_per_package, old.location_id, NULL, {_SQL_NOW});
+        END
+    ''')
+
+# --- Recherche plein texte (FTS5) ---
+# Index FTS5 "externe" (content='inventory') synchronisé par triggers. Si SQLite n'est
+# pas compilé avec FTS5, search_inventory retombe sur l'ancienne recherche LIKE.
+
+SEARCH_COLUMNS = ('product_name', 'lot_number', 'palette_number', 'location_id')
+_fts_available = None # None = pas encore déterminé
+
+def _init_search_index(cursor):
+    """Crée la table FTS5 et ses triggers si possible. Retourne True si FTS5 est utilisable."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inventory_fts'")
+    created = cursor.fetchone() is None
     try:
-        conn = get_db_connection() # Utiliser la fonction get_db_connection pour la cohérence
-        if conn is None:
-             # get_db_connection loggue déjà l'erreur
-             Logger.error("DB: Échec de l'obtention de la connexion pour l'initialisation.")
-             return # Ne pas continuer si la connexion échoue
-
-        cursor = conn.cursor()
-        Logger.info("DB: Connexion établie. Création de la table 'inventory' si elle n'existe pas...")
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS inventory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                palette_number TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                price REAL,
-                expiry_date TEXT,
-                lot_number TEXT NOT NULL,
-                boxes_per_package INTEGER,
-                location_id TEXT,
-                timestamp TEXT NOT NULL,
-                UNIQUE(palette_number) -- On suppose que le numéro de palette est unique
+            CREATE VIRTUAL TABLE IF NOT EXISTS inventory_fts USING fts5(
+                product_name, lot_number, palette_number, location_id,
+                content='inventory', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 1', prefix='2 3'
             )
         ''')
-        # Ajouter un index pour accélérer les recherches
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lot_number ON inventory (lot_number)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_name ON inventory (product_name)')
-        conn.commit()
+    except sqlite3.OperationalError as e:
+        Logger.warning(f"DB: FTS5 indisponible ({e}). Recherche par LIKE utilisée.")
+        return False
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_ai AFTER INSERT ON inventory BEGIN
+            INSERT INTO inventory_fts (rowid, product_name, lot_number, palette_number, location_id)
+            VALUES (new.id, new.product_name, new.lot_number, new.palette_number, new.location_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_ad AFTER DELETE ON inventory BEGIN
+            INSERT INTO inventory_fts (inventory_fts, rowid, product_name, lot_number, palette_number, location_id)
+            VALUES ('delete', old.id, old.product_name, old.lot_number, old.palette_number, old.location_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_au
+        AFTER UPDATE OF product_name, lot_number, palette_number, location_id ON inventory BEGIN
+            INSERT INTO inventory_fts (inventory_fts, rowid, product_name, lot_number, palette_number, location_id)
+            VALUES ('delete', old.id, old.product_name, old.lot_number, old.palette_number, old.location_id);
+            INSERT INTO inventory_fts (rowid, product_name, lot_number, palette_number, location_id)
+            VALUES (new.id, new.product_name, new.lot_number, new.palette_number, new.location_id);
+        END
+    ''')
+    if created:
+        # Indexer les lignes déjà présentes (base existante avant FTS5)
+        cursor.execute("INSERT INTO inventory_fts (inventory_fts) VALUES ('rebuild')")
+        Logger.info("DB: Index plein texte 'inventory_fts' créé et rempli.")
+    return True
+
+def _use_fts():
+    """Indique si l'index FTS5 existe (déterminé une seule fois)."""
+    global _fts_available
+    if _fts_available is None:
+        with read_connection() as conn:
+            row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inventory_fts'").fetchone()
+        _fts_available = row is not None
+    return _fts_available
+
+def _fts_match_expression(query, search_by):
+    """
+    Construit l'expression MATCH: chaque terme devient un préfixe ("terme"*), tous requis (AND),
+    limité à la colonne search_by (ou à toutes les colonnes indexées si search_by == 'all').
+    Retourne None si la requête ne contient aucun terme.
+    """
+    terms = [term.replace('"', '') for term in query.split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return None
+    expression = ' AND '.join(f'"{term}"*' for term in terms)
+    if search_by == 'all':
+        return expression
+    return f'{search_by} : ({expression})'
+
+def init_db():
+    """Initialise la base de données et crée la table si elle n'existe pas."""
+    global _fts_available
+    db_path = get_connection_manager().db_path
+    Logger.info(f"DB: Tentative d'initialisation de la base de données à: {db_path}")
+    try:
+        with write_transaction() as conn:
+            cursor = conn.cursor()
+            Logger.info("DB: Connexion établie. Création de la table 'inventory' si elle n'existe pas...")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS inventory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    palette_number TEXT NOT NULL,
+                    product_name TEXT NOT NULL,
+                    price REAL,
+                    expiry_date TEXT,
+                    lot_number TEXT NOT NULL,
+                    boxes_per_package INTEGER,
+                    location_id TEXT,
+                    timestamp TEXT NOT NULL,
+                    UNIQUE(palette_number) -- On suppose que le numéro de palette est unique
+                )
+            ''')
+            # Ajouter un index pour accélérer les recherches
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_lot_number ON inventory (lot_number)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_name ON inventory (product_name)')
+            _migrate_location_index(cursor)
+            _init_movements(cursor)
+            fts_available = _init_search_index(cursor)
+        _fts_available = fts_available
         Logger.info("DB: Table 'inventory' et index vérifiés/créés avec succès.")
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur SQLite lors de l'initialisation de la table/index: {e}")
-        if conn:
-            conn.rollback() # Annuler les changements partiels si possible
     except Exception as e:
         Logger.error(f"DB: Erreur inattendue lors de l'initialisation: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close() # Assurer la fermeture de la connexion
-            Logger.info("DB: Connexion d'initialisation fermée.")
 
 
 def get_db_connection():
-    """Crée et retourne une connexion à la base de données."""
-    db_path = get_db_path()
+    """
+    Crée et retourne une nouvelle connexion indépendante (configurée comme celles du gestionnaire).
+    L'appelant doit la fermer. Les fonctions du module utilisent read_connection()/write_transaction().
+    """
+    manager = get_connection_manager()
     try:
-        conn = sqlite3.connect(db_path)
-        # Utiliser Row pour accéder aux colonnes par nom
-        conn.row_factory = sqlite3.Row
-        return conn
+        return manager.connect()
     except sqlite3.Error as e:
-        Logger.error(f"DB: Erreur de connexion à la base de données {db_path}: {e}")
+        Logger.error(f"DB: Erreur de connexion à la base de données {manager.db_path}: {e}")
         return None
 
+# --- Cache de lecture (lots et palettes) ---
+# Un scan relit souvent le même lot / la même palette à quelques secondes d'intervalle.
+# Cache LRU borné avec expiration: les écritures du module invalident précisément les
+# clés touchées, le TTL borne le retard sur les écritures faites par d'autres appareils.
+
+CACHE_MAX_ENTRIES = 256 # Nombre max de clés (lots + palettes) en cache
+CACHE_TTL = 30 # secondes
+
+class LookupCache:
+    """Cache LRU avec TTL et compteurs de hits/misses. Les valeurs sont copiées à la sortie."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # clé -> (expiration, valeur)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Retourne (trouvé, valeur)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, _copy_cached(entry[1])
+                del self._entries[key] # Expirée
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, _copy_cached(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False) # Moins récemment utilisée
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+def _copy_cached(value):
+    # Les appelants modifient parfois les enregistrements retournés (ex: timestamp de suppression)
+    if isinstance(value, list):
+        return [record.copy() for record in value]
+    if value is not None:
+        return value.copy()
+    return None
+
+_lookup_cache = LookupCache()
+
+def _invalidate_lookups(palette_number, lot_number=None):
+    """Invalide les entrées de cache touchées par une écriture sur une palette (et son lot)."""
+    _lookup_cache.invalidate(('palette', palette_number), ('lot', lot_number))
+
+def get_cache_stats():
+    """Compteurs du cache de lecture: {'hits', 'misses', 'size', 'hit_rate'}."""
+    return _lookup_cache.stats()
+
 def check_existing_palette(palette_number):
     """Vérifie si une palette existe et retourne ses infos si oui."""
-    conn = get_db_connection()
-    if not conn: return None
-    record_dict = None
+    found, record = _lookup_cache.get(('palette', palette_number))
+    if found:
+        return record
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM inventory WHERE palette_number = ?", (palette_number,))
-        record = cursor.fetchone()
-        if record:
-            # Retourner sous forme de dictionnaire pour un accès facile par nom de colonne
-            columns = [description[0] for description in cursor.description]
-            record_dict = dict(zip(columns, record))
+        with read_connection() as conn:
+            # InventoryRecord: accès par nom de colonne comme un dictionnaire
+            cursor = _inventory_cursor(conn)
+            cursor.execute(f"SELECT {INVENTORY_SELECT} FROM inventory WHERE palette_number = ?", (palette_number,))
+            record = cursor.fetchone()
+        _lookup_cache.put(('palette', palette_number), record) # Y compris "absente" (None)
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur lors de la vérification de la palette {palette_number}: {e}")
-    finally:
-        conn.close()
-    return record_dict
+    return record
 
 def get_palette_at_location(location_id):
     """Vérifie si un emplacement est occupé et retourne le numéro de palette si oui (utilise l'ID normalisé)."""
-    conn = get_db_connection()
     normalized_loc_id = normalize_location_id(location_id) # Normaliser
-    if not conn or normalized_loc_id is None: return None
+    if normalized_loc_id is None: return None
     palette_num = None
     try:
-        cursor = conn.cursor()
-        # Chercher une palette à cet emplacement spécifique (normalisé)
-        cursor.execute("SELECT palette_number FROM inventory WHERE location_id = ?", (normalized_loc_id,)) # Utiliser l'ID normalisé
-        record = cursor.fetchone()
-        if record:
-            palette_num = record['palette_number']
-            Logger.info(f"DB: Emplacement {location_id} est occupé par palette {palette_num}.")
-        # else: Logger.info(f"DB: Emplacement {location_id} est libre.") # Optionnel
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            # Recherche ponctuelle dans l'index unique idx_location_unique (ID normalisé)
+            cursor.execute("SELECT palette_number FROM inventory WHERE location_id = ?", (normalized_loc_id,))
+            record = cursor.fetchone()
+            if record:
+                palette_num = record['palette_number']
+                Logger.info(f"DB: Emplacement {location_id} est occupé par palette {palette_num}.")
+            # else: Logger.info(f"DB: Emplacement {location_id} est libre.") # Optionnel
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur lors de la vérification de l'emplacement {normalized_loc_id}: {e}")
-    finally:
-        if conn:
-            conn.close()
     return palette_num # Retourne le numéro de palette ou None
 
 def check_existing_lot(lot_number):
     """Vérifie si un numéro de lot existe déjà dans la base de données."""
-    conn = get_db_connection()
-    if not conn: return []
+    found, records_list = _lookup_cache.get(('lot', lot_number))
+    if found:
+        return records_list
     records_list = []
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM inventory WHERE lot_number = ?", (lot_number,))
-        records = cursor.fetchall()
-        if records:
+        with read_connection() as conn:
             # Retourner la liste des enregistrements existants pour ce lot
-            columns = [description[0] for description in cursor.description]
-            records_list = [dict(zip(columns, record)) for record in records]
+            cursor = _inventory_cursor(conn)
+            cursor.execute(f"SELECT {INVENTORY_SELECT} FROM inventory WHERE lot_number = ?", (lot_number,))
+            records_list = cursor.fetchall()
+        _lookup_cache.put(('lot', lot_number), records_list)
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur lors de la vérification du lot {lot_number}: {e}")
-    finally:
-        conn.close()
     return records_list # Retourne une liste vide si le lot n'existe pas ou en cas d'erreur
 
 def add_palette(data):
     """Ajoute une nouvelle palette à la base de données (utilise l'ID d'emplacement normalisé)."""
-    conn = get_db_connection()
     normalized_loc_id = normalize_location_id(data.get('location_id')) # Normaliser
-    if not conn: return False
     success = False
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO inventory (
-                palette_number, product_name, price, expiry_date, lot_number,
-                boxes_per_package, location_id, timestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['palette_number'], data['product_name'], data.get('price'),
-            data['expiry_date'], data['lot_number'], data.get('boxes_per_package'),
-            normalized_loc_id, data['timestamp'] # Utiliser l'ID normalisé
-        ))
-        conn.commit()
+        with write_transaction() as conn:
+            conn.execute('''
+                INSERT INTO inventory (
+                    palette_number, product_name, price, expiry_date, lot_number,
+                    boxes_per_package, location_id, timestamp
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data['palette_number'], data['product_name'], data.get('price'),
+                data['expiry_date'], data['lot_number'], data.get('boxes_per_package'),
+                normalized_loc_id, data['timestamp'] # Utiliser l'ID normalisé
+            ))
+        _invalidate_lookups(data['palette_number'], data['lot_number'])
         Logger.info(f"DB: Palette {data['palette_number']} ajoutée avec succès à l'emplacement {normalized_loc_id}.")
         success = True
-    except sqlite3.IntegrityError:
-        Logger.error(f"DB: La palette {data['palette_number']} existe déjà (Violation d'unicité).")
-        conn.rollback() # Important en cas d'erreur
+    # Le rollback est fait par write_transaction() en cas d'exception
+    except sqlite3.IntegrityError as e:
+        if 'location_id' in str(e):
+            Logger.error(f"DB: L'emplacement {normalized_loc_id} est déjà occupé (Violation d'unicité).")
+        else:
+            Logger.error(f"DB: La palette {data['palette_number']} existe déjà (Violation d'unicité).")
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur SQLite lors de l'ajout de la palette {data['palette_number']}: {e}")
-        conn.rollback()
     except Exception as e:
         Logger.error(f"DB: Erreur inattendue lors de l'ajout de la palette {data['palette_number']}: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
     return success
 
 def update_palette_location(palette_number, location_id, timestamp):
     """Met à jour l'emplacement et le timestamp d'une palette existante (utilise l'ID d'emplacement normalisé)."""
-    conn = get_db_connection()
     normalized_loc_id = normalize_location_id(location_id) # Normaliser
-    if not conn: return False
     success = False
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE inventory
-            SET location_id = ?, timestamp = ?
-            WHERE palette_number = ?
-        ''', (normalized_loc_id, timestamp, palette_number)) # Utiliser l'ID normalisé
-        conn.commit()
+        with write_transaction() as conn:
+            previous = conn.execute("SELECT location_id, lot_number FROM inventory WHERE palette_number = ?", (palette_number,)).fetchone()
+            cursor = conn.execute('''
+                UPDATE inventory
+                SET location_id = ?, timestamp = ?
+                WHERE palette_number = ?
+            ''', (normalized_loc_id, timestamp, palette_number)) # Utiliser l'ID normalisé
         if cursor.rowcount > 0:
+            _invalidate_lookups(palette_number, previous['lot_number'])
             Logger.info(f"DB: Emplacement de la palette {palette_number} mis à jour vers {normalized_loc_id}.")
             success = True
         else:
             Logger.warning(f"DB: Palette {palette_number} non trouvée pour la mise à jour d'emplacement {normalized_loc_id}.")
             # Considérer ceci comme un échec car l'update n'a pas eu lieu
+    except sqlite3.IntegrityError:
+        Logger.error(f"DB: L'emplacement {normalized_loc_id} est déjà occupé (Violation d'unicité).")
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur SQLite lors de la mise à jour de l'emplacement pour {palette_number}: {e}")
-        conn.rollback()
     except Exception as e:
         Logger.error(f"DB: Erreur inattendue lors de la mise à jour de l'emplacement pour {palette_number}: {e}")
-        conn.rollback() # Corrected indentation
-    finally:
-        conn.close()
     return success
 
 def delete_palette(palette_number):
     """Supprime une palette de la base de données par son numéro."""
-    conn = get_db_connection()
-    if not conn: return False
     success = False
     try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM inventory WHERE palette_number = ?", (palette_number,))
-        conn.commit()
+        with write_transaction() as conn:
+            previous = conn.execute("SELECT location_id, lot_number FROM inventory WHERE palette_number = ?", (palette_number,)).fetchone()
+            cursor = conn.execute("DELETE FROM inventory WHERE palette_number = ?", (palette_number,))
         if cursor.rowcount > 0:
+            _invalidate_lookups(palette_number, previous['lot_number'])
             Logger.info(f"DB: Palette {palette_number} supprimée avec succès.")
             success = True
         else:
@@ -237,50 +747,374 @@ def delete_palette(palette_number):
             success = False
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur SQLite lors de la suppression de la palette {palette_number}: {e}")
-        conn.rollback()
     except Exception as e:
         Logger.error(f"DB: Erreur inattendue lors de la suppression de la palette {palette_number}: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
     return success
 
+# Statuts retournés par commit_scan
+SCAN_OK = 'ok'
+SCAN_OCCUPIED = 'occupied' # Emplacement déjà occupé
+SCAN_DUPLICATE = 'duplicate' # Ajout d'une palette déjà présente
+SCAN_NOT_FOUND = 'not_found' # Déplacement d'une palette absente
+SCAN_ERROR = 'error'
+
+def commit_scan(product_data, location_id, timestamp, action='ADD'):
+    """
+    Enregistre un scan d'emplacement en une seule transaction (BEGIN IMMEDIATE):
+    vérifie que l'emplacement est libre, ajoute (action='ADD') ou déplace (action='MOVE')
+    la palette, puis relit l'enregistrement complet (avec son id).
+    Le verrou d'écriture est pris avant la vérification: deux appareils ne peuvent pas
+    réserver le même emplacement libre entre la vérification et l'écriture.
+
+    Retourne un dict {'status': SCAN_*, 'record': InventoryRecord|None, 'occupied_by': str|None}.
+    """
+    normalized_loc_id = normalize_location_id(location_id) # Normaliser
+    palette_number = product_data['palette_number']
+    result = {'status': SCAN_ERROR, 'record': None, 'occupied_by': None}
+    if not normalized_loc_id:
+        Logger.error(f"DB: Emplacement invalide '{location_id}' pour la palette {palette_number}.")
+        return result
+    try:
+        with write_transaction() as conn:
+            occupant = conn.execute("SELECT palette_number FROM inventory WHERE location_id = ?",
+                                    (normalized_loc_id,)).fetchone()
+            if occupant:
+                # Même si c'est la palette déplacée: on impose un emplacement vide
+                result['status'] = SCAN_OCCUPIED
+                result['occupied_by'] = occupant['palette_number']
+                Logger.info(f"DB: Emplacement {normalized_loc_id} est occupé par palette {occupant['palette_number']}.")
+                return result
+
+            if action == 'ADD':
+                cursor = conn.execute('''
+                    INSERT INTO inventory (
+                        palette_number, product_name, price, expiry_date, lot_number,
+                        boxes_per_package, location_id, timestamp
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    palette_number, product_data['product_name'], product_data.get('price'),
+                    product_data['expiry_date'], product_data['lot_number'], product_data.get('boxes_per_package'),
+                    normalized_loc_id, timestamp
+                ))
+                record = _inventory_cursor(conn).execute(
+                    f"SELECT {INVENTORY_SELECT} FROM inventory WHERE id = ?", (cursor.lastrowid,)).fetchone()
+            elif action == 'MOVE':
+                cursor = conn.execute('''
+                    UPDATE inventory
+                    SET location_id = ?, timestamp = ?
+                    WHERE palette_number = ?
+                ''', (normalized_loc_id, timestamp, palette_number))
+                if cursor.rowcount == 0:
+                    result['status'] = SCAN_NOT_FOUND
+                    Logger.warning(f"DB: Palette {palette_number} non trouvée pour la mise à jour d'emplacement {normalized_loc_id}.")
+                    return result
+                record = _inventory_cursor(conn).execute(
+                    f"SELECT {INVENTORY_SELECT} FROM inventory WHERE palette_number = ?", (palette_number,)).fetchone()
+            else:
+                Logger.error(f"DB: Action de scan non valide: {action}")
+                return result
+
+            result['status'] = SCAN_OK
+            result['record'] = record
+        _invalidate_lookups(palette_number, record.lot_number)
+        Logger.info(f"DB: Scan {action} validé: palette {palette_number} à l'emplacement {normalized_loc_id} (id {result['record']['id']}).")
+    except sqlite3.IntegrityError:
+        # Transaction annulée par write_transaction()
+        result = {'status': SCAN_DUPLICATE, 'record': None, 'occupied_by': None}
+        Logger.error(f"DB: La palette {palette_number} existe déjà (Violation d'unicité).")
+    except sqlite3.Error as e:
+        result = {'status': SCAN_ERROR, 'record': None, 'occupied_by': None}
+        Logger.error(f"DB: Erreur SQLite lors du scan {action} de la palette {palette_number}: {e}")
+    except Exception as e:
+        result = {'status': SCAN_ERROR, 'record': None, 'occupied_by': None}
+        Logger.error(f"DB: Erreur inattendue lors du scan {action} de la palette {palette_number}: {e}")
+    return result
+
+BULK_CHUNK_SIZE = 500 # Lignes par transaction pour add_palettes_bulk
+_BULK_MAX_CHUNK = 900 # Reste sous la limite historique de 999 paramètres SQLite (clauses IN)
+
+def _bulk_row_params(data, default_timestamp):
+    """Prépare le tuple d'insertion d'une palette (KeyError/ValueError si données invalides)."""
+    price = data.get('price')
+    boxes = data.get('boxes_per_package')
+    return (
+        str(data['palette_number']), data['product_name'],
+        float(price) if price not in (None, '') else None,
+        data['expiry_date'], data['lot_number'],
+        int(boxes) if boxes not in (None, '') else None,
+        normalize_location_id(data.get('location_id')) or None,
+        data.get('timestamp') or default_timestamp
+    )
+
+def _add_palettes_chunk(chunk, results):
+    """Insère un bloc de palettes en une transaction et complète results (mêmes indices)."""
+    default_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    candidates = [] # (index, params)
+    for index, data in chunk:
+        try:
+            candidates.append((index, _bulk_row_params(data, default_timestamp)))
+        except (KeyError, ValueError, TypeError) as e:
+            results[index].update(status=SCAN_ERROR, error=f"Données invalides: {e}")
+    if not candidates:
+        return
+
+    try:
+        with write_transaction() as conn:
+            palettes = [params[0] for _, params in candidates]
+            locations = [params[6] for _, params in candidates if params[6] is not None]
+            placeholders = ','.join('?' * len(palettes))
+            existing_palettes = {row[0] for row in conn.execute(
+                f"SELECT palette_number FROM inventory WHERE palette_number IN ({placeholders})", palettes)}
+            occupied = {}
+            if locations:
+                placeholders = ','.join('?' * len(locations))
+                occupied = {row[0]: row[1] for row in conn.execute(
+                    f"SELECT location_id, palette_number FROM inventory WHERE location_id IN ({placeholders})", locations)}
+
+            to_insert = []
+            for index, params in candidates:
+                palette_number, location_id = params[0], params[6]
+                if palette_number in existing_palettes:
+                    results[index].update(status=SCAN_DUPLICATE, error=f"Palette {palette_number} déjà présente")
+                elif location_id is not None and location_id in occupied:
+                    results[index].update(status=SCAN_OCCUPIED, occupied_by=occupied[location_id],
+                                          error=f"Emplacement {location_id} occupé par palette {occupied[location_id]}")
+                else:
+                    # Réserver aussi pour les lignes suivantes du même bloc
+                    existing_palettes.add(palette_number)
+                    if location_id is not None:
+                        occupied[location_id] = palette_number
+                    to_insert.append((index, params))
+
+            conn.executemany('''
+                INSERT INTO inventory (
+                    palette_number, product_name, price, expiry_date, lot_number,
+                    boxes_per_package, location_id, timestamp
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [params for _, params in to_insert])
+            ids = {}
+            if to_insert:
+                inserted = [params[0] for _, params in to_insert]
+                placeholders = ','.join('?' * len(inserted))
+                ids = {row[1]: row[0] for row in conn.execute(
+                    f"SELECT id, palette_number FROM inventory WHERE palette_number IN ({placeholders})", inserted)}
+    except sqlite3.Error as e:
+        # Tout le bloc est annulé: aucune ligne candidate n'a été écrite
+        Logger.error(f"DB: Erreur SQLite lors de l'ajout groupé ({len(candidates)} palette(s)): {e}")
+        for index, _ in candidates:
+            results[index].update(status=SCAN_ERROR, occupied_by=None, error=f"Erreur SQLite: {e}")
+        return
+
+    for index, params in to_insert:
+        _invalidate_lookups(params[0], params[4])
+        results[index].update(status=SCAN_OK, id=ids.get(params[0]))
+
+def add_palettes_bulk(products, chunk_size=BULK_CHUNK_SIZE, progress_callback=None):
+    """
+    Ajoute un ensemble de palettes (dicts au format parse_product_qr + 'location_id',
+    'timestamp' optionnel) avec executemany, par transactions de chunk_size lignes.
+    Les conflits (palette déjà présente, emplacement occupé, y compris au sein du lot) et les
+    lignes invalides sont signalés ligne par ligne sans interrompre le reste du lot.
+
+    progress_callback(traitées) est appelé après chaque bloc.
+    Retourne une liste (ordre d'entrée) de dicts
+    {'palette_number', 'status': SCAN_*, 'id', 'occupied_by', 'error'}.
+    """
+    chunk_size = max(1, min(chunk_size, _BULK_MAX_CHUNK))
+    results = []
+    chunk = []
+    for data in products:
+        results.append({'palette_number': data.get('palette_number'), 'status': SCAN_ERROR,
+                        'id': None, 'occupied_by': None, 'error': None})
+        chunk.append((len(results) - 1, data))
+        if len(chunk) >= chunk_size:
+            _add_palettes_chunk(chunk, results)
+            chunk = []
+            if progress_callback:
+                progress_callback(len(results))
+    if chunk:
+        _add_palettes_chunk(chunk, results)
+        if progress_callback:
+            progress_callback(len(results))
+    added = sum(1 for result in results if result['status'] == SCAN_OK)
+    Logger.info(f"DB: Ajout groupé terminé: {added}/{len(results)} palette(s) ajoutée(s).")
+    return results
+
+SEARCH_PAGE_SIZE = 200 # Lignes lues par page lors du parcours des résultats
+
+def _search_filter(query, search_by):
+    """
+    Décrit les lignes correspondant à une recherche: (source, condition, params, clé)
+    où clé est la colonne id utilisée pour la pagination. Retourne None si la requête
+    ne peut rien trouver. ValueError si search_by n'est pas valide.
+    """
+    if search_by != 'all' and search_by not in SEARCH_COLUMNS:
+        raise ValueError(f"Type de recherche non valide: {search_by}")
+    if _use_fts():
+        match_expression = _fts_match_expression(query, search_by)
+        if match_expression is None:
+            return None
+        return ("inventory_fts JOIN inventory ON inventory.id = inventory_fts.rowid",
+                "inventory_fts MATCH ?", (match_expression,), "inventory_fts.rowid")
+    columns = SEARCH_COLUMNS if search_by == 'all' else (search_by,)
+    condition = "(" + " OR ".join(f"{column} LIKE ?" for column in columns) + ")"
+    return "inventory", condition, ('%' + query + '%',) * len(columns), "inventory.id"
+
+def iter_search_inventory(query, search_by='lot_number', page_size=SEARCH_PAGE_SIZE, ranked=False):
+    """
+    Générateur: parcourt les résultats de recherche page par page (pagination par clé sur id:
+    "id > dernier id vu"), sans jamais charger plus de page_size lignes en mémoire.
+    Une connexion de lecture n'est empruntée que le temps de lire chaque page.
+
+    ranked=True (FTS5 uniquement): pages triées par pertinence (clé (score bm25, id)). Chaque
+    page recalcule le score de toutes les correspondances: à réserver aux premières pages
+    affichées, pas au parcours complet d'une recherche large.
+    Les erreurs SQLite sont propagées à l'appelant.
+    """
+    search_filter = _search_filter(query, search_by)
+    if search_filter is None:
+        return
+    source, condition, params, key = search_filter
+
+    if ranked and _use_fts():
+        sql_query = f'''
+            SELECT * FROM (
+                SELECT {INVENTORY_SELECT}, bm25(inventory_fts) AS _score FROM {source} WHERE {condition}
+            )
+            WHERE _score > ? OR (_score = ? AND id > ?)
+            ORDER BY _score, id LIMIT ?
+        '''
+        last_score, last_id = float('-inf'), -1
+        while True:
+            with read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = None # Tuples simples: colonnes d'inventaire puis _score
+                page = cursor.execute(sql_query, params + (last_score, last_score, last_id, page_size)).fetchall()
+            for row in page:
+                yield InventoryRecord(*row[:-1])
+            if len(page) < page_size:
+                return
+            last_score, last_id = page[-1][-1], page[-1][0]
+
+    sql_query = f"SELECT {INVENTORY_SELECT} FROM {source} WHERE {condition} AND {key} > ? ORDER BY {key} LIMIT ?"
+    last_id = -1
+    while True:
+        with read_connection() as conn:
+            page = _inventory_cursor(conn).execute(sql_query, params + (last_id, page_size)).fetchall()
+        yield from page
+        if len(page) < page_size:
+            return
+        last_id = page[-1].id
+
+def count_search_results(query, search_by='lot_number', cancel_event=None):
+    """
+    Compte les résultats d'une recherche (requête séparée du parcours des pages).
+    cancel_event (threading.Event): si positionné pendant le comptage, la requête SQLite
+    est interrompue et la fonction retourne None. Retourne aussi None en cas d'erreur.
+    """
+    try:
+        search_filter = _search_filter(query, search_by)
+        if search_filter is None:
+            return 0
+        source, condition, params, _ = search_filter
+        if source != "inventory":
+            source = "inventory_fts" # Le comptage n'a pas besoin de la jointure
+        with read_connection() as conn:
+            if cancel_event is not None:
+                # Appelé toutes les 1000 instructions de la VM SQLite: une valeur non nulle interrompt la requête
+                conn.set_progress_handler(lambda: 1 if cancel_event.is_set() else 0, 1000)
+            try:
+                return conn.execute(f"SELECT COUNT(*) FROM {source} WHERE {condition}", params).fetchone()[0]
+            finally:
+                conn.set_progress_handler(None, 0)
+    except sqlite3.OperationalError as e:
+        if cancel_event is not None and cancel_event.is_set():
+            Logger.info(f"DB: Comptage annulé pour '{query}' ({search_by}).")
+        else:
+            Logger.error(f"DB: Erreur SQLite lors du comptage pour '{query}' ({search_by}): {e}")
+    except ValueError as e:
+        Logger.warning(f"DB: {e}")
+    except sqlite3.Error as e:
+        Logger.error(f"DB: Erreur SQLite lors du comptage pour '{query}' ({search_by}): {e}")
+    return None
+
 def search_inventory(query, search_by='lot_number'):
-    """Recherche dans l'inventaire par numéro de lot ou nom de produit."""
-    conn = get_db_connection()
-    if not conn: return []
+    """
+    Recherche dans l'inventaire par numéro de lot, nom de produit ou tous les champs ('all').
+    Avec FTS5: recherche par préfixe de mots, multi-termes. Sans FTS5: recherche LIKE '%query%'.
+    Retourne la liste complète (triée par id): pour les grands résultats, préférer
+    iter_search_inventory() et count_search_results().
+    """
     results_list = []
     try:
-        cursor = conn.cursor()
-        sql_query = ""
-        params = ('%' + query + '%',)
-
-        if search_by == 'lot_number':
-            sql_query = "SELECT * FROM inventory WHERE lot_number LIKE ?"
-        elif search_by == 'product_name':
-            sql_query = "SELECT * FROM inventory WHERE product_name LIKE ?"
-        else:
-            Logger.warning(f"DB: Type de recherche non valide: {search_by}")
-            return []
-
-        cursor.execute(sql_query, params)
-        results = cursor.fetchall()
-        if results:
-            columns = [description[0] for description in cursor.description]
-            # Convertir les résultats en liste de dictionnaires
-            results_list = [dict(zip(columns, row)) for row in results]
+        results_list = list(iter_search_inventory(query, search_by))
+        if results_list:
             Logger.info(f"DB: Recherche pour '{query}' ({search_by}) a retourné {len(results_list)} résultat(s).")
         else:
              Logger.info(f"DB: Aucune correspondance trouvée pour '{query}' ({search_by}).")
-
+    except ValueError as e:
+        Logger.warning(f"DB: {e}")
     except sqlite3.Error as e:
         Logger.error(f"DB: Erreur SQLite lors de la recherche pour '{query}' ({search_by}): {e}")
     except Exception as e:
          Logger.error(f"DB: Erreur inattendue lors de la recherche pour '{query}' ({search_by}): {e}")
-    finally:
-        if conn:
-            conn.close()
     return results_list
 
+def iter_inventory(page_size=SEARCH_PAGE_SIZE):
+    """Générateur: tout l'inventaire lu page par page (ordre d'id), en mémoire bornée."""
+    sql_query = f"SELECT {INVENTORY_SELECT} FROM inventory WHERE id > ? ORDER BY id LIMIT ?"
+    last_id = -1
+    while True:
+        with read_connection() as conn:
+            page = _inventory_cursor(conn).execute(sql_query, (last_id, page_size)).fetchall()
+        yield from page
+        if len(page) < page_size:
+            return
+        last_id = page[-1].id
+
+def get_row_counts():
+    """Nombre de lignes de l'inventaire et du journal des mouvements: {'inventory': n, 'movements': n}."""
+    with read_connection() as conn:
+        return {
+            'inventory': conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0],
+            'movements': conn.execute("SELECT COUNT(*) FROM movements").fetchone()[0],
+        }
+
+def _query_movements(description, sql_query, params):
+    """Exécute une requête d'historique et retourne une liste de dicts (liste vide en cas d'erreur)."""
+    try:
+        with read_connection() as conn:
+            return [dict(row) for row in conn.execute(sql_query, params)]
+    except sqlite3.Error as e:
+        Logger.error(f"DB: Erreur SQLite lors de la lecture de l'historique ({description}): {e}")
+        return []
+
+def get_palette_history(palette_number):
+    """Historique des mouvements d'une palette (ordre chronologique), y compris après suppression."""
+    return _query_movements(f"palette {palette_number}",
+        f"SELECT {_MOVEMENT_SELECT} FROM movements WHERE palette_number = ? ORDER BY seq", (palette_number,))
+
+def get_lot_history(lot_number):
+    """Historique des mouvements de toutes les palettes d'un lot (ordre chronologique)."""
+    return _query_movements(f"lot {lot_number}",
+        f"SELECT {_MOVEMENT_SELECT} FROM movements WHERE lot_number = ? ORDER BY seq", (lot_number,))
+
+def get_movements_between(start, end):
+    """Mouvements dont le timestamp ('AAAA-MM-JJ HH:MM:SS') est dans [start, end[."""
+    return _query_movements(f"{start} -> {end}",
+        f"SELECT {_MOVEMENT_SELECT} FROM movements WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, seq",
+        (start, end))
+
+def iter_movements(after_seq=0, page_size=SEARCH_PAGE_SIZE):
+    """Générateur: tous les mouvements de seq > after_seq, lus page par page (ordre de seq)."""
+    sql_query = f"SELECT {_MOVEMENT_SELECT} FROM movements WHERE seq > ? ORDER BY seq LIMIT ?"
+    while True:
+        with read_connection() as conn:
+            page = [dict(row) for row in conn.execute(sql_query, (after_seq, page_size))]
+        yield from page
+        if len(page) < page_size:
+            return
+        after_seq = page[-1]['seq']
+
 # Initialiser la DB au démarrage du module si nécessaire
 # init_db() # Il est préférable de l'appeler explicitement depuis main.py
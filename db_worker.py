@@ -0,0 +1,125 @@
+# db_worker.py
+import queue
+import threading
+from concurrent.futures import Future
+from kivy.clock import Clock
+from kivy.logger import Logger # Importer Logger
+
+import db_manager
+
+DEFAULT_TIMEOUT = 10 # secondes, pour les lectures (None = pas de délai)
+
+class DbFuture(Future):
+    """
+    Future d'une requête exécutée par le DatabaseWorker.
+    cancel() retire la requête de la file si elle n'a pas démarré, ou interrompt la
+    lecture SQLite en cours; dans les deux cas le callback n'est jamais appelé.
+    """
+
+    def __init__(self, worker, func, args, kwargs, callback):
+        super().__init__()
+        self._worker = worker
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.abandoned = False # Annulée ou expirée: résultat ignoré
+        self.delivered = False # Callback déjà appelé (une seule fois)
+
+    def cancel(self):
+        self.abandoned = True
+        if super().cancel():
+            return True
+        if self.running():
+            # Future.cancel() ne peut pas arrêter une tâche démarrée: interrompre la requête SQLite
+            self._worker.interrupt(self)
+        return False
+
+class DatabaseWorker:
+    """
+    Thread dédié exécutant tous les accès à db_manager depuis une file de requêtes.
+    Le thread principal Kivy ne bloque jamais sur SQLite: submit() retourne immédiatement
+    un DbFuture et le callback(result, error) est appelé sur le thread UI via Clock.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._current = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='DatabaseWorker', daemon=True)
+            self._thread.start()
+            Logger.info("DBWORKER: Thread de base de données démarré.")
+
+    def stop(self, timeout=5):
+        """Termine les requêtes déjà en file puis arrête le thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+            Logger.info("DBWORKER: Thread de base de données arrêté.")
+        self._thread = None
+
+    def submit(self, func, *args, callback=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+        """
+        Met func(*args, **kwargs) en file. callback(result, error) est appelé sur le thread UI
+        (error = None ou message). Après timeout secondes sans résultat, la requête est annulée
+        et callback reçoit une erreur de délai. Utiliser timeout=None pour les écritures.
+        """
+        future = DbFuture(self, func, args, kwargs, callback)
+        future.add_done_callback(self._on_done)
+        self._queue.put(future)
+        if timeout is not None:
+            Clock.schedule_once(lambda dt: self._on_timeout(future, timeout), timeout)
+        return future
+
+    def interrupt(self, future):
+        # Seules les lectures du thread du worker sont interrompues (pas celles d'un export en cours)
+        thread = self._thread
+        if self._current is future and thread is not None:
+            db_manager.interrupt_reads(thread.ident)
+
+    def _run(self):
+        while True:
+            future = self._queue.get()
+            if future is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue # Annulée avant de démarrer
+            self._current = future
+            try:
+                result = future.func(*future.args, **future.kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self._current = None
+
+    def _on_done(self, future):
+        # Appelé sur le thread du worker: repasser sur le thread UI
+        if future.abandoned or future.callback is None:
+            return
+        Clock.schedule_once(lambda dt: self._deliver(future))
+
+    def _deliver(self, future):
+        if future.delivered or future.abandoned:
+            return
+        future.delivered = True
+        error = future.exception()
+        if error is not None:
+            Logger.error(f"DBWORKER: Erreur dans {getattr(future.func, '__name__', future.func)}: {error}")
+            future.callback(None, str(error))
+        else:
+            future.callback(future.result(), None)
+
+    def _on_timeout(self, future, timeout):
+        if future.done() or future.abandoned:
+            return
+        name = getattr(future.func, '__name__', future.func)
+        Logger.warning(f"DBWORKER: {name} n'a pas répondu en {timeout}s, annulation.")
+        future.cancel()
+        if future.callback is not None and not future.delivered:
+            future.delivered = True
+            future.callback(None, f"Base de données indisponible (délai de {timeout}s dépassé)")
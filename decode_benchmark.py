@@ -0,0 +1,190 @@
+# decode_benchmark.py
+"""
+Mesure la vitesse de décodage QR sur des enregistrements, sans caméra (utilisable en CI).
+
+Chaque enregistrement (fichier vidéo, ou répertoire d'images) représente un scan: ses images
+passent dans qr_decoder.QrDecoder comme celles de la caméra pendant un scan réel, soit une par
+une dans ce processus, soit (--workers N) dans scan_pipeline.ScanPipeline avec N décodeurs en
+parallèle, comme dans l'application: la comparaison des deux mesure le gain multi-cœur. Résultats:
+    images/s             images lues et décodées par seconde (toutes les images de chaque scan)
+    temps CPU            temps CPU total, et images ignorées car trop sombres ou floues
+    premier décodage     délai entre le début du scan et le premier QR décodé (p50, p95)
+    taux d'échec         part des scans où aucun QR n'a été décodé
+Le corpus est un répertoire dont chaque fichier vidéo ou sous-répertoire d'images est un
+scan (un répertoire ne contenant que des images est lui-même un scan).
+
+Usage:
+    python decode_benchmark.py corpus/
+    python decode_benchmark.py corpus/ --pace 30 --max-miss-rate 0.05 --json resultats.json
+    python decode_benchmark.py corpus/ --workers 4 --pace 30
+"""
+import os
+# Empêcher Kivy d'interpréter les arguments de la ligne de commande
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+import argparse
+import json
+import math
+import sys
+import time
+
+import frame_sources
+import qr_decoder
+import scan_pipeline
+
+def percentile(values, fraction):
+    """Percentile (rang le plus proche) d'une liste de valeurs, None si elle est vide."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+def list_recordings(corpus):
+    """Enregistrements du corpus (chemins), triés par nom."""
+    if os.path.isdir(corpus) and not frame_sources.is_recording(corpus):
+        paths = [os.path.join(corpus, name) for name in sorted(os.listdir(corpus))]
+        return [path for path in paths if frame_sources.is_recording(path)]
+    return [corpus]
+
+def run_recording(path, pace=None, max_frames=None, min_symbols=1):
+    """
+    Rejoue un enregistrement, image par image. pace: images/s de la caméra simulée (None = aussi
+    vite que possible; sinon les images arrivées pendant un décodage sont sautées, et le délai
+    jusqu'au premier décodage inclut l'attente des images).
+    Retourne {'path', 'frames', 'decoded_frames', 'skipped_frames', 'seconds', 'cpu_seconds',
+    'first_decode_ms', 'payload', 'error'}.
+    """
+    source = frame_sources.open_frame_source(path, pace)
+    decoder = qr_decoder.QrDecoder()
+    result = _new_result(path)
+    with source:
+        error = source.open()
+        if error:
+            result['error'] = error
+            return result
+        start_time = time.perf_counter()
+        cpu_start = time.process_time()
+        while max_frames is None or decoder.frames < max_frames:
+            frame, error = source.read()
+            if error:
+                if error != frame_sources.END_OF_SOURCE:
+                    result['error'] = error
+                break
+            symbols = decoder.decode(frame, min_symbols)
+            if symbols and result['first_decode_ms'] is None:
+                result['first_decode_ms'] = (time.perf_counter() - start_time) * 1000
+                result['payload'] = symbols[0].data
+        result['seconds'] = time.perf_counter() - start_time
+        result['cpu_seconds'] = time.process_time() - cpu_start
+    result['frames'] = decoder.frames
+    result['decoded_frames'] = decoder.decoded_frames
+    result['skipped_frames'] = decoder.skipped_frames
+    return result
+
+def run_recording_pipeline(path, workers, pace=None, max_frames=None, min_symbols=1, cpu_budget=0):
+    """
+    Rejoue un enregistrement dans scan_pipeline.ScanPipeline avec workers décodeurs (cpu_budget:
+    voir scan_pipeline.FramePacer, 0 = sans limite). Sans pace, la capture attend que chaque
+    image soit prise: toutes sont décodées. Même résultat que run_recording, plus 'captured'
+    et 'dropped' (images remplacées avant d'être décodées, avec pace).
+    """
+    source = frame_sources.open_frame_source(path, pace)
+    result = _new_result(path)
+    start_time = time.perf_counter()
+    cpu_start = time.process_time()
+    with scan_pipeline.ScanPipeline(source, workers, min_symbols, cpu_budget) as pipeline:
+        while max_frames is None or pipeline.captured < max_frames:
+            decoded = pipeline.next_result()
+            if decoded.error:
+                if decoded.error != frame_sources.END_OF_SOURCE:
+                    result['error'] = decoded.error
+                break
+            if decoded.symbols and result['first_decode_ms'] is None:
+                result['first_decode_ms'] = (time.perf_counter() - start_time) * 1000
+                result['payload'] = decoded.symbols[0].data
+    result['seconds'] = time.perf_counter() - start_time
+    result['cpu_seconds'] = time.process_time() - cpu_start
+    stats = pipeline.stats()
+    for key in ('frames', 'decoded_frames', 'skipped_frames', 'captured', 'dropped'):
+        result[key] = stats[key]
+    return result
+
+def _new_result(path):
+    return {'path': path, 'frames': 0, 'decoded_frames': 0, 'skipped_frames': 0, 'seconds': 0.0,
+            'cpu_seconds': 0.0, 'first_decode_ms': None, 'payload': None, 'error': None}
+
+def summarize(results):
+    frames = sum(result['frames'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    first_decodes = [result['first_decode_ms'] for result in results if result['first_decode_ms'] is not None]
+    misses = sum(1 for result in results if result['first_decode_ms'] is None)
+    return {
+        'recordings': len(results),
+        'frames': frames,
+        'decoded_frames': sum(result['decoded_frames'] for result in results),
+        'skipped_frames': sum(result['skipped_frames'] for result in results),
+        'cpu_seconds': sum(result['cpu_seconds'] for result in results),
+        'fps': frames / seconds if seconds else 0.0,
+        'first_decode_p50_ms': percentile(first_decodes, 0.50),
+        'first_decode_p95_ms': percentile(first_decodes, 0.95),
+        'misses': misses,
+        'miss_rate': misses / len(results) if results else 0.0,
+    }
+
+def _format_ms(value):
+    return f"{value:.0f} ms" if value is not None else "-"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure la vitesse de décodage QR sur des enregistrements (sans caméra).")
+    parser.add_argument('corpus', help="Répertoire d'enregistrements, fichier vidéo ou répertoire d'images")
+    parser.add_argument('--pace', type=float, help="Images/s de la caméra simulée (défaut: aussi vite que possible)")
+    parser.add_argument('--max-frames', type=int, help="Images lues au plus par enregistrement")
+    parser.add_argument('--workers', type=int,
+                        help="Décoder dans scan_pipeline avec ce nombre de décodeurs en parallèle "
+                             "(défaut: décodage image par image, sans pipeline)")
+    parser.add_argument('--cpu-budget', type=float, default=0,
+                        help="Avec --workers: budget CPU en cœurs (défaut: 0, sans limite)")
+    parser.add_argument('--pair', action='store_true',
+                        help="Décoder comme le scan produit + emplacement (deux QR attendus par image)")
+    parser.add_argument('--json', help="Fichier JSON des résultats (détail par enregistrement)")
+    parser.add_argument('--max-miss-rate', type=float,
+                        help="Code de sortie 1 si le taux d'échec dépasse cette valeur (0 à 1)")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers doit être supérieur ou égal à 1")
+
+    recordings = list_recordings(args.corpus)
+    if not recordings:
+        print(f"Aucun enregistrement dans {args.corpus}.", file=sys.stderr)
+        return 2
+
+    results = []
+    for path in recordings:
+        min_symbols = 2 if args.pair else 1
+        if args.workers:
+            result = run_recording_pipeline(path, args.workers, args.pace, args.max_frames, min_symbols, args.cpu_budget)
+        else:
+            result = run_recording(path, args.pace, args.max_frames, min_symbols)
+        results.append(result)
+        status = result['error'] or (f"premier QR en {_format_ms(result['first_decode_ms'])}"
+                                     if result['first_decode_ms'] is not None else "aucun QR décodé")
+        print(f"{os.path.basename(path)}: {result['frames']} image(s), {status}", file=sys.stderr)
+
+    summary = summarize(results)
+    mode = f"pipeline, {args.workers} décodeur(s)" if args.workers else "image par image"
+    print(f"{summary['recordings']} enregistrement(s), {summary['frames']} image(s): {summary['fps']:.1f} images/s ({mode})")
+    print(f"Premier décodage: p50 {_format_ms(summary['first_decode_p50_ms'])}, "
+          f"p95 {_format_ms(summary['first_decode_p95_ms'])}")
+    print(f"Temps CPU: {summary['cpu_seconds']:.2f}s, {summary['skipped_frames']} image(s) sombre(s)/floue(s) ignorée(s)")
+    print(f"Taux d'échec: {summary['miss_rate']:.1%} ({summary['misses']}/{summary['recordings']})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'recordings': results}, f, ensure_ascii=False, indent=2)
+    if args.max_miss_rate is not None and summary['miss_rate'] > args.max_miss_rate:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,41 @@
 # excel_manager.py
-import openpyxl
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment
+# openpyxl est importé à la première utilisation (long à charger, inutile au démarrage si le
+# journal n'est pas en xlsx)
+import json
 import os
+import threading
+import time
 from datetime import datetime
+from itertools import islice
 from kivy.app import App # Pour obtenir le chemin user_data_dir
 from kivy.logger import Logger # Importer Logger
 
-EXCEL_FILE_NAME = 'warehouse_log.xlsx'
+import db_manager
+
+EXCEL_FILE_NAME = 'warehouse_log.xlsx' # ancien fichier unique, conservé en lecture
+LOG_FILE_PATTERN = 'warehouse_log_{}.xlsx' # {} = clé de partition, ex. 'warehouse_log_2025-03.xlsx'
+LOG_PARTITION = 'month' # 'day', 'month' ou 'year': un nouveau fichier par période
+PARTITION_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'} # Valeurs possibles de LOG_PARTITION
+LOG_INDEX_FILE_NAME = 'warehouse_log.index.jsonl' # plage de dates, nombre de lignes et palettes par fichier (ajouts en fin)
+INDEX_CHUNK_SIZE = 1000 # lignes lues par bloc lors de la reconstruction de l'index
 SHEET_NAME = 'InventoryLog'
+HEADERS = [
+    "ID_DB", "Action", "Timestamp", "Palette", "Produit", "Prix",
+    "Date Expiration", "Lot", "Boites/Colis", "Emplacement"
+]
+COLUMN_WIDTH = 18
+FLUSH_INTERVAL = 5 # secondes entre deux écritures groupées du journal tamponné
+FLUSH_ROWS = 20 # écriture anticipée dès que ce nombre de lignes est en attente
+SPOOL_FILE_NAME = 'excel_spool.jsonl' # lignes en attente d'écriture dans le fichier Excel
+RETRY_MAX_DELAY = 300 # secondes, délai max entre deux essais après un échec d'écriture
+EXPORT_FILE_PATTERN = 'inventory_export_{}.xlsx' # {} = horodatage de l'export
+EXPORT_CHUNK_SIZE = 1000 # lignes lues par page pendant l'export
+INVENTORY_SHEET_NAME = 'Inventaire'
+MOVEMENTS_SHEET_NAME = 'Mouvements'
+MOVEMENT_HEADERS = HEADERS + ["Emplacement précédent"]
 
-def get_excel_path():
-    """Retourne le chemin complet vers le fichier Excel."""
+def get_log_dir():
+    """Retourne le répertoire des fichiers du journal Excel (créé si nécessaire)."""
     # Utiliser user_data_dir pour un stockage approprié sur toutes les plateformes
     try:
         # Si l'application Kivy est en cours d'exécution
@@ -24,56 +48,81 @@ def get_excel_path():
         Logger.warning(f"EXCEL: Pas d'application Kivy active. Utilisation du répertoire local: {app_dir}")
         # Créer le répertoire s'il n'existe pas (également pour le cas hors-app)
         os.makedirs(app_dir, exist_ok=True)
-    excel_path = os.path.join(app_dir, EXCEL_FILE_NAME)
-    # Logger.info(f"EXCEL: Chemin du fichier Excel utilisé: {excel_path}") # Optionnel
-    return excel_path
+    return app_dir
+
+def partition_key(timestamp=None, period=None):
+    """Clé de partition ('2025-03' pour 'month') d'un timestamp 'AAAA-MM-JJ HH:MM:SS' (défaut: maintenant)."""
+    period = period or LOG_PARTITION
+    try:
+        moment = datetime.strptime(str(timestamp)[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        moment = datetime.now() # Timestamp absent ou illisible: partition courante
+    return moment.strftime(PARTITION_FORMATS[period])
+
+def get_excel_path(timestamp=None):
+    """Retourne le chemin complet du fichier Excel de la partition d'un timestamp (défaut: partition courante)."""
+    return os.path.join(get_log_dir(), LOG_FILE_PATTERN.format(partition_key(timestamp)))
+
+def list_log_files(log_dir=None, extension='xlsx'):
+    """
+    Chemins de tous les fichiers du journal d'un format ('xlsx', 'csv', 'jsonl'), du plus ancien
+    au plus récent: l'ancien fichier unique warehouse_log.xlsx puis les partitions. Seuls les noms
+    dont la clé est une date (voir partition_key) sont des partitions: un autre fichier du même
+    répertoire (index, ancien index 'warehouse_log_index.jsonl') n'est jamais relu comme journal.
+    """
+    log_dir = log_dir or get_log_dir()
+    prefix = LOG_FILE_PATTERN.split('{}')[0]
+    suffix = f'.{extension}'
+    partitions = sorted(name for name in os.listdir(log_dir) if name.startswith(prefix) and name.endswith(suffix)
+                        and _is_partition_key(name[len(prefix):-len(suffix)]))
+    files = [EXCEL_FILE_NAME] if extension == 'xlsx' and os.path.exists(os.path.join(log_dir, EXCEL_FILE_NAME)) else []
+    return [os.path.join(log_dir, name) for name in files + partitions]
 
-def init_excel():
-    """Initialise le fichier Excel et crée l'en-tête si nécessaire."""
-    excel_path = get_excel_path()
+def _is_partition_key(key):
+    return bool(key) and all(char.isdigit() or char == '-' for char in key)
+
+def _format_headers(sheet):
+    """Mise en forme des en-têtes (Gras, Centré) et largeur des colonnes."""
+    from openpyxl.styles import Font, Alignment
+    from openpyxl.utils import get_column_letter
+    for col_num in range(1, len(HEADERS) + 1):
+        cell = sheet.cell(row=1, column=col_num)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        # Ajuster la largeur de colonne (approximatif)
+        column_letter = get_column_letter(col_num)
+        sheet.column_dimensions[column_letter].width = COLUMN_WIDTH
+
+def init_excel(excel_path=None):
+    """Initialise le fichier Excel (défaut: partition courante) et crée l'en-tête si nécessaire."""
+    excel_path = excel_path or get_excel_path()
+    file_name = os.path.basename(excel_path)
     Logger.info(f"EXCEL: Initialisation du fichier Excel à: {excel_path}")
     try:
+        import openpyxl
         if not os.path.exists(excel_path):
             workbook = openpyxl.Workbook()
             sheet = workbook.active
             sheet.title = SHEET_NAME
-            # Définir les en-têtes
-            headers = [
-                "ID_DB", "Action", "Timestamp", "Palette", "Produit", "Prix",
-                "Date Expiration", "Lot", "Boites/Colis", "Emplacement"
-            ]
-            sheet.append(headers)
-            # Mise en forme des en-têtes (Gras, Centré)
-            for col_num, header in enumerate(headers, 1):
-                cell = sheet.cell(row=1, column=col_num)
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-                # Ajuster la largeur de colonne (approximatif)
-                column_letter = get_column_letter(col_num)
-                sheet.column_dimensions[column_letter].width = 18
-
+            sheet.append(HEADERS)
+            _format_headers(sheet)
             workbook.save(excel_path)
-            Logger.info(f"EXCEL: Fichier '{EXCEL_FILE_NAME}' créé avec succès.")
+            Logger.info(f"EXCEL: Fichier '{file_name}' créé avec succès.")
         else:
-            # Vérifier si la feuille existe, sinon la créer (pour les fichiers existants corrompus)
-            workbook = openpyxl.load_workbook(excel_path)
-            if SHEET_NAME not in workbook.sheetnames:
+            # Vérifier si la feuille existe, sinon la créer (pour les fichiers existants corrompus).
+            # read_only: seule la liste des feuilles est lue, pas leur contenu
+            workbook = openpyxl.load_workbook(excel_path, read_only=True)
+            sheet_exists = SHEET_NAME in workbook.sheetnames
+            workbook.close()
+            if not sheet_exists:
+                workbook = openpyxl.load_workbook(excel_path)
                 sheet = workbook.create_sheet(SHEET_NAME)
-                headers = [
-                    "ID_DB", "Action", "Timestamp", "Palette", "Produit", "Prix",
-                    "Date Expiration", "Lot", "Boites/Colis", "Emplacement"
-                ]
-                sheet.append(headers)
-                for col_num, header in enumerate(headers, 1):
-                    cell = sheet.cell(row=1, column=col_num)
-                    cell.font = Font(bold=True)
-                    cell.alignment = Alignment(horizontal='center')
-                    column_letter = get_column_letter(col_num)
-                    sheet.column_dimensions[column_letter].width = 18
+                sheet.append(HEADERS)
+                _format_headers(sheet)
                 workbook.save(excel_path)
                 Logger.info(f"EXCEL: Feuille '{SHEET_NAME}' ajoutée au fichier existant.")
             else:
-                 Logger.info(f"EXCEL: Fichier '{EXCEL_FILE_NAME}' existe déjà.")
+                 Logger.info(f"EXCEL: Fichier '{file_name}' existe déjà.")
 
     except PermissionError:
         Logger.error(f"EXCEL: Erreur de permission. Impossible d'écrire dans '{excel_path}'. Vérifiez si le fichier est ouvert.")
@@ -81,53 +130,35 @@ def init_excel():
         Logger.error(f"EXCEL: Erreur lors de l'initialisation du fichier Excel: {e}")
 
 
-def add_record_to_excel(data, action="UNKNOWN"):
-    """Ajoute un enregistrement (ligne) au fichier Excel."""
-    excel_path = get_excel_path()
+def record_to_row(data, action):
+    """Prépare la ligne Excel d'un enregistrement, dans l'ordre des en-têtes."""
+    return [
+        data.get('id', 'N/A'), # ID de la base de données si disponible
+        action, # Type d'action (ADD, MOVE, etc.)
+        data.get('timestamp', datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        data.get('palette_number', 'N/A'),
+        data.get('product_name', 'N/A'),
+        data.get('price', 'N/A'),
+        data.get('expiry_date', 'N/A'),
+        data.get('lot_number', 'N/A'),
+        data.get('boxes_per_package', 'N/A'),
+        data.get('location_id', 'N/A')
+    ]
+
+def _append_to_file(excel_path, rows):
+    """Ajoute des lignes à un fichier du journal en un seul chargement/enregistrement. Retourne True/False."""
     try:
+        import openpyxl
+        if not os.path.exists(excel_path):
+            init_excel(excel_path) # Nouvelle partition (rotation) ou fichier supprimé
         workbook = openpyxl.load_workbook(excel_path)
         sheet = workbook[SHEET_NAME] # Accéder à la feuille par son nom
-
-        # Préparer la ligne de données dans le bon ordre
-        row_data = [
-            data.get('id', 'N/A'), # ID de la base de données si disponible
-            action, # Type d'action (ADD, MOVE, etc.)
-            data.get('timestamp', datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            data.get('palette_number', 'N/A'),
-            data.get('product_name', 'N/A'),
-            data.get('price', 'N/A'),
-            data.get('expiry_date', 'N/A'),
-            data.get('lot_number', 'N/A'),
-            data.get('boxes_per_package', 'N/A'),
-            data.get('location_id', 'N/A')
-        ]
-        sheet.append(row_data)
+        for row_data in rows:
+            sheet.append(row_data)
         workbook.save(excel_path)
-        Logger.info(f"EXCEL: Enregistrement ajouté pour palette {data.get('palette_number', '?')} (Action: {action}).")
+        Logger.info(f"EXCEL: {len(rows)} enregistrement(s) ajouté(s) à '{os.path.basename(excel_path)}'.")
         return True
 
-    except FileNotFoundError:
-        Logger.error(f"EXCEL: Fichier '{excel_path}' non trouvé. Tentative de réinitialisation...")
-        init_excel() # Tenter de recréer le fichier
-        # Essayer d'ajouter à nouveau après réinitialisation
-        try:
-            workbook = openpyxl.load_workbook(excel_path)
-            sheet = workbook[SHEET_NAME]
-            row_data = [
-                data.get('id', 'N/A'), action,
-                data.get('timestamp', datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                data.get('palette_number', 'N/A'), data.get('product_name', 'N/A'),
-                data.get('price', 'N/A'), data.get('expiry_date', 'N/A'),
-                data.get('lot_number', 'N/A'), data.get('boxes_per_package', 'N/A'),
-                data.get('location_id', 'N/A')
-            ]
-            sheet.append(row_data)
-            workbook.save(excel_path)
-            Logger.info(f"EXCEL: Enregistrement ajouté après réinitialisation pour palette {data.get('palette_number', '?')}.")
-            return True
-        except Exception as e_retry:
-            Logger.error(f"EXCEL: Échec de l'ajout même après réinitialisation: {e_retry}")
-            return False
     except KeyError:
          Logger.error(f"EXCEL: La feuille '{SHEET_NAME}' n'existe pas dans '{excel_path}'. Vérifiez le fichier.")
          return False
@@ -135,7 +166,448 @@ def add_record_to_excel(data, action="UNKNOWN"):
         Logger.error(f"EXCEL: Erreur de permission. Impossible d'écrire dans '{excel_path}'. Vérifiez si le fichier est ouvert.")
         return False
     except Exception as e:
-        Logger.error(f"EXCEL: Erreur lors de l'ajout de l'enregistrement: {e}")
+        Logger.error(f"EXCEL: Erreur lors de l'ajout des enregistrements: {e}")
         return False
 
+def _append_rows(rows):
+    """
+    Écrit les lignes dans leurs partitions (selon leur timestamp), par suites consécutives
+    de même partition, et met à jour l'index. S'arrête au premier échec.
+    Retourne le nombre de lignes écrites depuis le début de rows.
+    """
+    _get_log_index() # Charger (ou reconstruire) l'index avant d'écrire: les lignes ne sont comptées qu'une fois
+    written = 0
+    while written < len(rows):
+        key = partition_key(rows[written][2])
+        end = written + 1
+        while end < len(rows) and partition_key(rows[end][2]) == key:
+            end += 1
+        file_name = LOG_FILE_PATTERN.format(key)
+        if not _append_to_file(os.path.join(get_log_dir(), file_name), rows[written:end]):
+            break
+        _update_log_index(file_name, rows[written:end])
+        written = end
+    return written
+
+def append_rows_to_excel(rows):
+    """Ajoute plusieurs lignes au journal Excel (une écriture par partition concernée). Retourne True si tout est écrit."""
+    return _append_rows(rows) == len(rows)
+
+_log_index = None # Index des fichiers du journal, chargé à la première utilisation
+_index_lock = threading.Lock()
+
+def get_log_index_path():
+    return os.path.join(get_log_dir(), LOG_INDEX_FILE_NAME)
+
+def _new_index_entry():
+    return {'start': None, 'end': None, 'rows': 0, 'palettes': set()}
+
+def _index_rows(entry, rows):
+    """Ajoute des lignes (dans l'ordre des en-têtes) à une entrée de l'index. Retourne les palettes nouvelles."""
+    new_palettes = set()
+    for row in rows:
+        timestamp = str(row[2])
+        if entry['start'] is None or timestamp < entry['start']:
+            entry['start'] = timestamp
+        if entry['end'] is None or timestamp > entry['end']:
+            entry['end'] = timestamp
+        palette_number = str(row[3])
+        if palette_number not in entry['palettes']:
+            new_palettes.add(palette_number)
+    entry['palettes'] |= new_palettes
+    entry['rows'] += len(rows)
+    return new_palettes
+
+def _index_line(file_name, entry, palettes):
+    return json.dumps({'file': file_name, 'start': entry['start'], 'end': entry['end'],
+                       'rows': entry['rows'], 'palettes': sorted(palettes)}, ensure_ascii=False) + '\n'
+
+def _merge_index_line(index, record):
+    """Applique une ligne de l'index (entrée complète ou ajout d'une écriture): lignes additionnées, palettes réunies."""
+    entry = index.setdefault(record['file'], _new_index_entry())
+    for key, pick in (('start', min), ('end', max)):
+        if record[key] is not None:
+            entry[key] = record[key] if entry[key] is None else pick(entry[key], record[key])
+    entry['rows'] += record['rows']
+    entry['palettes'].update(record['palettes'])
+
+def _read_log_index():
+    """Relit l'index (lignes JSON ajoutées à chaque écriture). None s'il est absent ou abîmé."""
+    index = {}
+    try:
+        with open(get_log_index_path(), encoding='utf-8') as f:
+            for line in f:
+                _merge_index_line(index, json.loads(line))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None # Ligne tronquée par un arrêt brutal: l'index est reconstruit
+    return index
+
+def _save_log_index(index):
+    # Réécriture atomique et compacte (une ligne par fichier): un index partiel n'est jamais visible
+    index_path = get_log_index_path()
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for file_name, entry in sorted(index.items()):
+            f.write(_index_line(file_name, entry, entry['palettes']))
+    os.replace(tmp_path, index_path)
+
+def rebuild_log_index():
+    """Reconstruit l'index en relisant tous les fichiers du journal (mode read_only, mémoire bornée)."""
+    global _log_index
+    import openpyxl
+    index = {}
+    for excel_path in list_log_files():
+        entry = _new_index_entry()
+        try:
+            workbook = openpyxl.load_workbook(excel_path, read_only=True)
+            try:
+                rows = workbook[SHEET_NAME].iter_rows(min_row=2, values_only=True)
+                while True:
+                    block = list(islice(rows, INDEX_CHUNK_SIZE))
+                    if not block:
+                        break
+                    _index_rows(entry, [row for row in block if row and len(row) > 3])
+            finally:
+                workbook.close()
+        except Exception as e:
+            Logger.error(f"EXCEL: Impossible d'indexer '{excel_path}': {e}")
+            continue
+        index[os.path.basename(excel_path)] = entry
+    with _index_lock:
+        _log_index = index
+        try:
+            _save_log_index(index)
+        except OSError as e:
+            Logger.error(f"EXCEL: Impossible d'enregistrer l'index du journal: {e}")
+    Logger.info(f"EXCEL: Index du journal reconstruit ({len(index)} fichier(s)).")
+    return index
+
+def _get_log_index():
+    """Index en mémoire, lu depuis le fichier sidecar (reconstruit s'il est absent ou illisible)."""
+    global _log_index
+    with _index_lock:
+        if _log_index is None:
+            _log_index = _read_log_index()
+            if _log_index is not None:
+                try:
+                    _save_log_index(_log_index) # Compacter les ajouts (une fois par démarrage)
+                except OSError as e:
+                    Logger.error(f"EXCEL: Impossible d'enregistrer l'index du journal: {e}")
+        index = _log_index
+    if index is None:
+        index = rebuild_log_index()
+    return index
+
+def load_log_index():
+    """
+    Retourne l'index des fichiers du journal: {nom_de_fichier: {'start', 'end', 'rows', 'palettes' (set)}}.
+    Reconstruit s'il manque un fichier présent sur disque (fichier copié à la main, index supprimé...).
+    """
+    index = _get_log_index()
+    if any(os.path.basename(path) not in index for path in list_log_files()):
+        index = rebuild_log_index()
+    return index
+
+def _update_log_index(file_name, rows):
+    """
+    Met à jour l'entrée d'un fichier après l'ajout de lignes (une erreur ici ne fait pas échouer
+    l'écriture). Seul l'ajout est écrit (une ligne en fin d'index, avec les palettes nouvelles):
+    le coût ne dépend pas de la taille de l'historique.
+    """
+    index = _get_log_index()
+    with _index_lock:
+        added = _new_index_entry()
+        known = index[file_name]['palettes'] if file_name in index else set()
+        new_palettes = _index_rows(added, rows) - known
+        _merge_index_line(index, {'file': file_name, 'start': added['start'], 'end': added['end'],
+                                  'rows': added['rows'], 'palettes': new_palettes})
+        try:
+            with open(get_log_index_path(), 'a', encoding='utf-8') as f:
+                f.write(_index_line(file_name, added, new_palettes))
+        except OSError as e:
+            Logger.error(f"EXCEL: Impossible d'enregistrer l'index du journal: {e}")
+
+def find_log_files(palette_number=None, start=None, end=None):
+    """
+    Fichiers du journal pouvant contenir des lignes d'une palette et/ou d'une période
+    [start, end] ('AAAA-MM-JJ HH:MM:SS'), d'après l'index: les autres ne sont pas ouverts.
+    """
+    log_dir = get_log_dir()
+    matches = []
+    for file_name, entry in sorted(load_log_index().items()):
+        if not entry['rows']:
+            continue
+        if palette_number is not None and str(palette_number) not in entry['palettes']:
+            continue
+        if start is not None and entry['end'] < start:
+            continue
+        if end is not None and entry['start'] > end:
+            continue
+        if os.path.exists(os.path.join(log_dir, file_name)):
+            matches.append(os.path.join(log_dir, file_name))
+    return matches
+
+def get_palette_log(palette_number):
+    """Toutes les lignes du journal Excel d'une palette (dicts par en-tête), en n'ouvrant que les fichiers concernés."""
+    import openpyxl
+    palette_number = str(palette_number)
+    results = []
+    for excel_path in find_log_files(palette_number):
+        try:
+            workbook = openpyxl.load_workbook(excel_path, read_only=True)
+            try:
+                for row in workbook[SHEET_NAME].iter_rows(min_row=2, values_only=True):
+                    if row and len(row) > 3 and str(row[3]) == palette_number:
+                        results.append(dict(zip(HEADERS, row)))
+            finally:
+                workbook.close()
+        except Exception as e:
+            Logger.error(f"EXCEL: Erreur lors de la lecture de '{excel_path}': {e}")
+    return results
+
+def add_record_to_excel(data, action="UNKNOWN"):
+    """Ajoute un enregistrement (ligne) au fichier Excel (écriture immédiate, voir BufferedExcelLog)."""
+    success = append_rows_to_excel([record_to_row(data, action)])
+    if success:
+        Logger.info(f"EXCEL: Enregistrement ajouté pour palette {data.get('palette_number', '?')} (Action: {action}).")
+    return success
+
+def get_spool_path():
+    """Retourne le chemin du spool des lignes en attente d'écriture dans le fichier Excel."""
+    return os.path.join(get_log_dir(), SPOOL_FILE_NAME)
+
+class BufferedExcelLog:
+    """
+    Journal Excel tamponné et durable: add() inscrit la ligne dans un spool JSONL sur disque
+    (append + fsync, coût constant par scan) et rend la main. Un thread d'arrière-plan vide
+    le spool dans le classeur par lots, toutes les flush_interval secondes ou dès flush_rows
+    lignes, avec un seul load_workbook/save par lot. Si l'écriture échoue (fichier ouvert
+    dans Excel...), les lignes restent dans le spool et l'essai est refait avec un délai
+    doublé à chaque échec (jusqu'à max_retry_delay). Le spool survit à un arrêt brutal:
+    il est vidé au démarrage suivant. En cas d'arrêt entre l'enregistrement du classeur et
+    la purge du spool, le dernier lot peut apparaître deux fois dans le fichier Excel.
+    """
+
+    def __init__(self, spool_path=None, flush_interval=FLUSH_INTERVAL, flush_rows=FLUSH_ROWS,
+                 max_retry_delay=RETRY_MAX_DELAY):
+        self.spool_path = spool_path or get_spool_path()
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.max_retry_delay = max_retry_delay
+        self._lock = threading.Lock() # Protège le fichier spool et le compteur
+        self._flush_lock = threading.Lock() # Un seul lot écrit à la fois
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._retry_delay = 0 # 0 = pas d'échec en cours
+        self._next_attempt = 0.0
+        with self._lock:
+            self._pending_count = self._count_spooled()
+        if self._pending_count:
+            Logger.info(f"EXCEL: {self._pending_count} enregistrement(s) en attente dans le spool.")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='BufferedExcelLog', daemon=True)
+            self._thread.start()
+
+    def add(self, data, action="UNKNOWN"):
+        """Inscrit un enregistrement dans le spool. Retourne False seulement si le spool est inaccessible."""
+        line = json.dumps(record_to_row(data, action), ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                with open(self.spool_path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+                    f.flush()
+                    os.fsync(f.fileno()) # Durable même en cas d'arrêt brutal
+                self._pending_count += 1
+                pending_count = self._pending_count
+        except OSError as e:
+            Logger.error(f"EXCEL: Impossible d'écrire dans le spool '{self.spool_path}': {e}")
+            return False
+        if pending_count >= self.flush_rows:
+            self._wake.set()
+        return True
+
+    def pending_count(self):
+        """Nombre de lignes en attente d'écriture dans le fichier Excel."""
+        return self._pending_count
+
+    def retry_in(self):
+        """Secondes avant le prochain essai après un échec (0 si aucun échec en cours)."""
+        if not self._retry_delay:
+            return 0
+        return max(0, self._next_attempt - time.monotonic())
+
+    def _count_spooled(self):
+        # Compter les lignes sans les décoder (appelé au démarrage)
+        try:
+            with open(self.spool_path, 'rb') as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def _read_spool(self):
+        rows = []
+        try:
+            with open(self.spool_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        # Ligne tronquée par un arrêt brutal pendant l'écriture
+                        Logger.warning("EXCEL: Ligne illisible ignorée dans le spool.")
+        except FileNotFoundError:
+            pass
+        return rows
+
+    def _write_spool(self, rows):
+        # Réécriture atomique: fichier temporaire puis remplacement
+        tmp_path = self.spool_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.spool_path)
+
+    def flush(self):
+        """Vide le spool dans le fichier Excel en un lot. Retourne False si l'écriture a échoué (lignes conservées)."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._read_spool()
+            if not batch:
+                return True
+            # Écriture par partition: en cas d'échec, seules les lignes déjà écrites sont retirées
+            written = _append_rows(batch)
+            if written:
+                try:
+                    with self._lock:
+                        # Retirer les lignes écrites, garder les lignes ajoutées entre-temps
+                        remaining = self._read_spool()[written:]
+                        self._write_spool(remaining)
+                        self._pending_count = len(remaining)
+                except OSError as e:
+                    Logger.error(f"EXCEL: Impossible de purger le spool '{self.spool_path}': {e}")
+                    return False
+            if written < len(batch):
+                self._retry_delay = min(max(self._retry_delay * 2, self.flush_interval), self.max_retry_delay)
+                self._next_attempt = time.monotonic() + self._retry_delay
+                Logger.warning(f"EXCEL: {len(batch) - written} enregistrement(s) conservé(s) dans le spool, "
+                               f"nouvel essai dans {self._retry_delay}s.")
+                return False
+            self._retry_delay = 0
+            return True
+
+    def close(self):
+        """Arrête le thread d'écriture et tente d'écrire les lignes restantes (conservées dans le spool sinon)."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.retry_in() if self._retry_delay else self.flush_interval)
+            self._wake.clear()
+            if self._stopped:
+                break
+            if self.retry_in() > 0:
+                continue # En attente après un échec: ne pas réessayer avant le délai
+            self.flush()
+
+def get_export_path():
+    """Retourne un nouveau chemin d'export horodaté, à côté du journal Excel."""
+    file_name = EXPORT_FILE_PATTERN.format(datetime.now().strftime("%Y%m%d_%H%M%S"))
+    return os.path.join(get_log_dir(), file_name)
+
+def _write_only_headers(sheet, headers):
+    """En-têtes mis en forme pour une feuille write_only (largeurs à définir avant la première ligne)."""
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment
+    from openpyxl.utils import get_column_letter
+    for col_num in range(1, len(headers) + 1):
+        sheet.column_dimensions[get_column_letter(col_num)].width = COLUMN_WIDTH
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        cells.append(cell)
+    sheet.append(cells)
+
+def _movement_to_row(movement):
+    """Ligne Excel d'un mouvement: mise en page du journal + emplacement précédent."""
+    return [
+        movement['inventory_id'], movement['action'], movement['timestamp'], movement['palette_number'],
+        movement['product_name'], movement['price'], movement['expiry_date'], movement['lot_number'],
+        movement['boxes_per_package'], movement['location_id'], movement['from_location']
+    ]
+
+def export_database_to_excel(export_path=None, chunk_size=EXPORT_CHUNK_SIZE, progress_callback=None,
+                             cancel_event=None):
+    """
+    Génère un nouveau fichier .xlsx depuis la base: feuille de l'inventaire actuel et feuille de
+    l'historique des mouvements. Le classeur est en mode write_only et les lignes sont lues par
+    pages de chunk_size: la mémoire reste bornée quel que soit le nombre de lignes.
+    À appeler hors du thread UI.
+    progress_callback(lignes_écrites, total): appelé après chaque page.
+    cancel_event (threading.Event): vérifié entre les pages; le fichier n'est alors pas créé.
+    Retourne (chemin, None) ou (None, message d'erreur).
+    """
+    export_path = export_path or get_export_path()
+    tmp_path = export_path + '.tmp'
+    start_time = time.time()
+    try:
+        import openpyxl
+        counts = db_manager.get_row_counts()
+        total = counts['inventory'] + counts['movements']
+        written = 0
+        workbook = openpyxl.Workbook(write_only=True)
+        sources = (
+            (INVENTORY_SHEET_NAME, HEADERS,
+             (record_to_row(record, "STOCK") for record in db_manager.iter_inventory(chunk_size))),
+            (MOVEMENTS_SHEET_NAME, MOVEMENT_HEADERS,
+             (_movement_to_row(movement) for movement in db_manager.iter_movements(page_size=chunk_size))),
+        )
+        for sheet_name, headers, rows in sources:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            sheet = workbook.create_sheet(sheet_name)
+            _write_only_headers(sheet, headers)
+            for row in rows:
+                sheet.append(row)
+                written += 1
+                if written % chunk_size == 0:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    if progress_callback:
+                        progress_callback(written, total)
+        if cancel_event is not None and cancel_event.is_set():
+            # Fermer les flux des feuilles (fichiers temporaires d'openpyxl) sans créer le fichier
+            for sheet in workbook.worksheets:
+                if not sheet.closed:
+                    sheet.close()
+            Logger.info(f"EXCEL: Export annulé après {written} ligne(s).")
+            return None, "Export annulé."
+        # Écrire dans un fichier temporaire: un export interrompu ne laisse pas de fichier incomplet
+        workbook.save(tmp_path)
+        os.replace(tmp_path, export_path)
+        if progress_callback:
+            progress_callback(written, max(total, written))
+        Logger.info(f"EXCEL: Export de {written} ligne(s) vers '{export_path}' en {time.time() - start_time:.1f}s.")
+        return export_path, None
+
+    except PermissionError:
+        Logger.error(f"EXCEL: Erreur de permission. Impossible d'écrire dans '{export_path}'.")
+        return None, f"Impossible d'écrire dans '{export_path}'."
+    except Exception as e:
+        Logger.error(f"EXCEL: Erreur lors de l'export de la base: {e}")
+        return None, f"Erreur lors de l'export: {e}"
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 # init_excel() # Appeler depuis main.py
@@ -0,0 +1,169 @@
+# frame_sources.py
+"""
+Sources d'images pour le scan QR. Toutes exposent la même interface que
+camera_session.CameraSession (la caméra en direct):
+    with source:
+        error = source.open()
+        frame, error = source.read()
+    source.close()
+Les sources enregistrées (fichier vidéo, répertoire d'images) permettent de rejouer un scan
+sans caméra, par exemple pour mesurer la vitesse de décodage (voir decode_benchmark.py).
+L'attribut live indique si la source, comme une caméra, produit des images à son propre rythme
+(les images non décodées à temps sont alors abandonnées par scan_pipeline).
+"""
+import os
+import time
+from kivy.logger import Logger # Importer Logger
+
+import camera_session
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp') # Fichiers lus par ImageDirectorySource
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov') # Fichiers lus par VideoFileSource
+END_OF_SOURCE = "Fin de l'enregistrement" # Erreur de read() quand toutes les images ont été lues
+
+class RecordedSource:
+    """
+    Base des sources enregistrées. Sans fps, chaque read() retourne l'image suivante (live=False:
+    la capture du scan attend que l'image précédente ait été prise, aucune n'est perdue).
+    Avec fps, la source se comporte comme une caméra à fps images/s (live=True): read() attend
+    l'image suivante, et saute celles qu'une caméra aurait déjà remplacées pendant un décodage lent.
+    """
+
+    def __init__(self, path, fps=None):
+        self.path = path
+        self.fps = fps
+        self.live = fps is not None
+        self._position = 0 # Images lues ou sautées depuis l'ouverture
+        self._start_time = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read(self):
+        """Retourne (image, None), ou (None, END_OF_SOURCE) après la dernière image."""
+        error = self.open()
+        if error:
+            return None, error
+        if self.fps:
+            now = time.perf_counter()
+            if self._start_time is None:
+                self._start_time = now
+            due = int((now - self._start_time) * self.fps) # Image que la caméra fournirait maintenant
+            if due < self._position:
+                time.sleep(self._start_time + self._position / self.fps - now)
+            while self._position < due:
+                if not self._skip_frame():
+                    return None, END_OF_SOURCE
+                self._position += 1
+        frame, error = self._read_frame()
+        if frame is not None:
+            self._position += 1
+        return frame, error
+
+    def _reset(self):
+        self._position = 0
+        self._start_time = None
+
+class VideoFileSource(RecordedSource):
+    """Images d'un fichier vidéo enregistré, dans l'ordre."""
+
+    def __init__(self, path, fps=None):
+        super().__init__(path, fps)
+        self._capture = None
+
+    def is_open(self):
+        return self._capture is not None
+
+    def open(self):
+        """Ouvre le fichier si nécessaire. Retourne None ou un message d'erreur."""
+        if self._capture is not None:
+            return None
+        import cv2
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            capture.release()
+            Logger.error(f"SCANNER: Impossible d'ouvrir la vidéo {self.path}.")
+            return f"Vidéo illisible: {os.path.basename(self.path)}"
+        self._capture = capture
+        self._reset()
+        return None
+
+    def _read_frame(self):
+        ret, frame = self._capture.read()
+        if not ret:
+            return None, END_OF_SOURCE
+        return frame, None
+
+    def _skip_frame(self):
+        return self._capture.grab()
+
+    def close(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+class ImageDirectorySource(RecordedSource):
+    """Images d'un répertoire (IMAGE_EXTENSIONS), dans l'ordre alphabétique des noms de fichiers."""
+
+    def __init__(self, path, fps=None):
+        super().__init__(path, fps)
+        self._files = None
+        self._index = 0
+
+    def is_open(self):
+        return self._files is not None
+
+    def open(self):
+        if self._files is not None:
+            return None
+        try:
+            names = sorted(name for name in os.listdir(self.path)
+                           if name.lower().endswith(IMAGE_EXTENSIONS))
+        except OSError as e:
+            Logger.error(f"SCANNER: Impossible de lire le répertoire {self.path}: {e}")
+            return f"Répertoire illisible: {self.path}"
+        self._files = [os.path.join(self.path, name) for name in names]
+        self._index = 0
+        self._reset()
+        return None
+
+    def _read_frame(self):
+        import cv2
+        while self._index < len(self._files):
+            path = self._files[self._index]
+            self._index += 1
+            frame = cv2.imread(path)
+            if frame is not None:
+                return frame, None
+            Logger.warning(f"SCANNER: Image illisible ignorée: {path}")
+        return None, END_OF_SOURCE
+
+    def _skip_frame(self):
+        if self._index >= len(self._files):
+            return False
+        self._index += 1
+        return True
+
+    def close(self):
+        self._files = None
+        self._index = 0
+
+def is_recording(path):
+    """True si path est un enregistrement rejouable (fichier vidéo ou répertoire contenant des images)."""
+    if os.path.isdir(path):
+        return any(name.lower().endswith(IMAGE_EXTENSIONS) for name in os.listdir(path))
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+def open_frame_source(spec=None, fps=None):
+    """
+    Source correspondant à spec: None ou 'camera' pour la caméra en direct (session partagée),
+    un répertoire pour ImageDirectorySource, sinon un fichier vidéo. fps: voir RecordedSource.
+    """
+    if spec in (None, '', 'camera'):
+        return camera_session.get_camera_session()
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, fps)
+    return VideoFileSource(spec, fps)
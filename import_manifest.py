@@ -0,0 +1,124 @@
+# import_manifest.py
+"""
+Importe un manifeste de réception (CSV ou JSONL) dans la base d'inventaire.
+
+Colonnes / clés attendues (format de qr_scanner.parse_product_qr + emplacement):
+    product_name, price, expiry_date, lot_number, boxes_per_package, palette_number,
+    location_id, timestamp (optionnel, défaut: maintenant)
+Une colonne 'qr' contenant le texte brut du QR produit peut remplacer les six champs produit.
+
+Usage:
+    python import_manifest.py reception.csv
+    python import_manifest.py reception.jsonl --db /chemin/database.db --chunk-size 1000
+"""
+import os
+# Empêcher Kivy d'interpréter les arguments de la ligne de commande
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+import argparse
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+import db_manager
+import qr_scanner
+
+def _row_to_product(row):
+    """Convertit une ligne du manifeste en dict produit. Retourne (product, erreur)."""
+    row = {key.strip(): value for key, value in row.items() if key}
+    qr_data = row.pop('qr', None)
+    if qr_data:
+        product, error = qr_scanner.parse_product_qr(qr_data)
+        if error:
+            return None, error
+        product['location_id'] = row.get('location_id')
+        product['timestamp'] = row.get('timestamp')
+        return product, None
+    missing = [key for key in ('palette_number', 'product_name', 'expiry_date', 'lot_number') if not row.get(key)]
+    if missing:
+        return None, f"Champs manquants: {', '.join(missing)}"
+    price = row.get('price')
+    if isinstance(price, str):
+        row['price'] = price.replace(',', '.') # Gérer virgule ou point décimal
+    return row, None
+
+def read_manifest(path, file_format=None):
+    """Lit le manifeste ligne par ligne et génère (numéro_de_ligne, product, erreur)."""
+    file_format = file_format or ('jsonl' if path.lower().endswith(('.jsonl', '.json')) else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if file_format == 'jsonl':
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"JSON invalide: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, f"Objet JSON attendu, obtenu {type(row).__name__}"
+                    continue
+                yield (line_number,) + _row_to_product(row)
+        else:
+            # Séparateur ',' ou ';' (export Excel FR)
+            sample = f.read(4096)
+            f.seek(0)
+            delimiter = ';' if sample.count(';') > sample.count(',') else ','
+            for line_number, row in enumerate(csv.DictReader(f, delimiter=delimiter), 2):
+                yield (line_number,) + _row_to_product(row)
+
+def import_manifest(path, file_format=None, chunk_size=db_manager.BULK_CHUNK_SIZE):
+    """Importe le manifeste par blocs et affiche les conflits. Retourne le nombre de lignes en échec."""
+    chunk_size = max(1, chunk_size) # Un bloc vide arrêterait l'import dès le début
+    counts = {}
+    lines = read_manifest(path, file_format)
+    start_time = time.time()
+    total = 0
+    while True:
+        block = list(islice(lines, chunk_size))
+        if not block:
+            break
+        valid = []
+        for line_number, product, error in block:
+            if error:
+                counts[db_manager.SCAN_ERROR] = counts.get(db_manager.SCAN_ERROR, 0) + 1
+                print(f"Ligne {line_number}: {error}", file=sys.stderr)
+            else:
+                valid.append((line_number, product))
+        results = db_manager.add_palettes_bulk([product for _, product in valid], chunk_size)
+        for (line_number, _), result in zip(valid, results):
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            if result['status'] != db_manager.SCAN_OK:
+                print(f"Ligne {line_number}: {result['status']} - {result['error']}", file=sys.stderr)
+        total += len(block)
+        print(f"{total} ligne(s) traitée(s)...", file=sys.stderr)
+
+    elapsed = time.time() - start_time
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    print(f"Import terminé en {elapsed:.1f}s: {total} ligne(s) ({summary or 'aucune'}).")
+    return total - counts.get(db_manager.SCAN_OK, 0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importe un manifeste de palettes (CSV/JSONL) dans l'inventaire.")
+    parser.add_argument('manifest', help="Fichier .csv ou .jsonl")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Format du fichier (déduit de l'extension par défaut)")
+    parser.add_argument('--db', help="Chemin de la base (défaut: base de l'application)")
+    parser.add_argument('--chunk-size', type=int, default=db_manager.BULK_CHUNK_SIZE,
+                        help="Lignes par transaction (défaut: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size doit être supérieur ou égal à 1")
+
+    if args.db:
+        db_manager.open_db(args.db)
+    db_manager.init_db()
+    try:
+        failures = import_manifest(args.manifest, args.format, args.chunk_size)
+    finally:
+        db_manager.close_db()
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
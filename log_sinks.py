@@ -0,0 +1,218 @@
+# log_sinks.py
+"""
+Destinations du journal des opérations (ADD, MOVE, DELETE), interchangeables:
+    csv   - fichiers CSV partitionnés (warehouse_log_2025-03.csv), ajout en O(1)
+    jsonl - fichiers JSON Lines partitionnés (warehouse_log_2025-03.jsonl), ajout en O(1)
+    xlsx  - classeurs Excel partitionnés, écrits par lots en arrière-plan (excel_manager.BufferedExcelLog)
+Plusieurs destinations peuvent être actives en même temps (create_log_sink("csv,jsonl")).
+Toutes exposent: start(), add(data, action), flush(), close(), pending_count(), retry_in().
+"""
+import csv
+import io
+import json
+import os
+import threading
+import time
+from kivy.logger import Logger # Importer Logger
+
+import excel_manager
+
+LOG_FIELDS = ('id', 'action', 'timestamp', 'palette_number', 'product_name', 'price',
+              'expiry_date', 'lot_number', 'boxes_per_package', 'location_id') # ordre de excel_manager.HEADERS
+DEFAULT_SINKS = 'csv'
+FSYNC_ROWS = 20 # fsync dès que ce nombre de lignes n'est pas encore sur disque
+FSYNC_INTERVAL = 2 # secondes, délai max avant fsync des lignes écrites
+CSV_DELIMITER = ';' # séparateur attendu par Excel en français
+
+class FileLogSink:
+    """
+    Journal en ajout seul dans un fichier texte par partition (voir excel_manager.LOG_PARTITION).
+    add() écrit une ligne dans le fichier ouvert (coût constant, pas de relecture); les fsync
+    sont groupés: toutes les FSYNC_ROWS lignes, ou par le thread d'arrière-plan après
+    FSYNC_INTERVAL secondes. Un arrêt brutal du système peut perdre les lignes non synchronisées,
+    un arrêt de l'application non (chaque ligne est transmise au système à l'écriture).
+    """
+    name = None
+    extension = None
+
+    def __init__(self, log_dir=None, fsync_rows=FSYNC_ROWS, fsync_interval=FSYNC_INTERVAL):
+        self.log_dir = log_dir or excel_manager.get_log_dir()
+        self.fsync_rows = fsync_rows
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._file = None
+        self._partition = None
+        self._unsynced = 0 # Lignes écrites mais pas encore synchronisées sur disque
+
+    def get_path(self, partition):
+        return os.path.join(self.log_dir, f"warehouse_log_{partition}.{self.extension}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'{type(self).__name__}', daemon=True)
+            self._thread.start()
+
+    def _open(self, partition):
+        """Ouvre (ou crée) le fichier de la partition; ferme le précédent (rotation)."""
+        self._sync()
+        if self._file is not None:
+            self._file.close()
+        path = self.get_path(partition)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._partition = partition
+        if is_new:
+            self._write_header(self._file)
+            Logger.info(f"LOG: Fichier journal '{os.path.basename(path)}' créé.")
+
+    def _write_header(self, f):
+        pass
+
+    def _format(self, row):
+        raise NotImplementedError
+
+    def add(self, data, action="UNKNOWN"):
+        """Ajoute un enregistrement. Retourne False si le fichier n'a pas pu être écrit."""
+        row = excel_manager.record_to_row(data, action)
+        line = self._format(row)
+        try:
+            with self._lock:
+                partition = excel_manager.partition_key(row[2])
+                if partition != self._partition:
+                    self._open(partition)
+                self._file.write(line)
+                self._file.flush()
+                self._unsynced += 1
+                if self._unsynced >= self.fsync_rows:
+                    self._sync()
+        except OSError as e:
+            Logger.error(f"LOG: Impossible d'écrire dans le journal {self.name}: {e}")
+            return False
+        return True
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def flush(self):
+        """Synchronise sur disque les lignes déjà écrites. Retourne False en cas d'erreur."""
+        try:
+            with self._lock:
+                self._sync()
+        except OSError as e:
+            Logger.error(f"LOG: Erreur de synchronisation du journal {self.name}: {e}")
+            return False
+        return True
+
+    def pending_count(self):
+        return 0 # Les lignes sont écrites immédiatement
+
+    def retry_in(self):
+        return 0
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        success = self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._partition = None
+        return success
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.fsync_interval)
+            if not self._stopped:
+                self.flush()
+
+class CsvLogSink(FileLogSink):
+    name = 'csv'
+    extension = 'csv'
+
+    def _write_header(self, f):
+        f.write('\ufeff') # BOM: Excel reconnaît l'UTF-8 (accents)
+        f.write(self._format(excel_manager.HEADERS))
+
+    def _format(self, row):
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=CSV_DELIMITER).writerow(row)
+        return buffer.getvalue()
+
+class JsonlLogSink(FileLogSink):
+    name = 'jsonl'
+    extension = 'jsonl'
+
+    def _format(self, row):
+        return json.dumps(dict(zip(LOG_FIELDS, row)), ensure_ascii=False, default=str) + '\n'
+
+class XlsxLogSink(excel_manager.BufferedExcelLog):
+    """Classeurs Excel partitionnés, via le spool durable de BufferedExcelLog."""
+    name = 'xlsx'
+
+    def _run(self):
+        # Vérification du classeur sur le thread d'écriture: ne retarde pas l'affichage au démarrage
+        start_time = time.perf_counter()
+        try:
+            excel_manager.init_excel()
+        except Exception as e:
+            Logger.error(f"LOG: Erreur lors de l'initialisation Excel: {e}")
+            # Les enregistrements restent dans le spool jusqu'à ce que le fichier soit accessible
+        Logger.info(f"STARTUP: Journal xlsx prêt en {(time.perf_counter() - start_time) * 1000:.0f} ms.")
+        super()._run()
+
+class MultiLogSink:
+    """Envoie chaque enregistrement à plusieurs destinations."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.name = ','.join(sink.name for sink in self.sinks)
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+
+    def add(self, data, action="UNKNOWN"):
+        """Retourne True si toutes les destinations ont accepté l'enregistrement."""
+        results = [sink.add(data, action) for sink in self.sinks]
+        return all(results)
+
+    def flush(self):
+        return all([sink.flush() for sink in self.sinks])
+
+    def close(self):
+        return all([sink.close() for sink in self.sinks])
+
+    def pending_count(self):
+        return sum(sink.pending_count() for sink in self.sinks)
+
+    def retry_in(self):
+        return max((sink.retry_in() for sink in self.sinks), default=0)
+
+SINK_TYPES = {sink_type.name: sink_type for sink_type in (CsvLogSink, JsonlLogSink, XlsxLogSink)}
+
+def create_log_sink(names=DEFAULT_SINKS):
+    """
+    Crée le journal à partir d'une liste de noms séparés par des virgules ("csv", "jsonl,xlsx"...).
+    Les noms inconnus sont ignorés; sans nom valide, DEFAULT_SINKS est utilisé.
+    """
+    sinks = []
+    for name in (part.strip().lower() for part in names.split(',')):
+        if not name:
+            continue
+        if name not in SINK_TYPES:
+            Logger.warning(f"LOG: Destination de journal inconnue ignorée: '{name}'")
+        elif name not in (sink.name for sink in sinks):
+            sinks.append(SINK_TYPES[name]())
+    if not sinks:
+        sinks = [SINK_TYPES[name]() for name in DEFAULT_SINKS.split(',')]
+    Logger.info(f"LOG: Destinations du journal: {', '.join(sink.name for sink in sinks)}")
+    return sinks[0] if len(sinks) == 1 else MultiLogSink(sinks)
@@ -1,5 +1,8 @@
 # main.py
 import os
+import threading
+import time
+_START_TIME = time.perf_counter() # Début du démarrage, pour le détail des durées par phase
 # Définir les variables d'environnement Kivy avant d'importer d'autres modules Kivy
 # os.environ['KIVY_LOG_LEVEL'] = 'debug' # Pour plus d'infos de debug
 from kivy.app import App
@@ -17,9 +20,21 @@ from kivy.logger import Logger
 from kivy.uix.popup import Popup # Import Popup base class
 
 import db_manager
+import db_worker
 import excel_manager
+import log_sinks
+import camera_session
 import qr_scanner
+import scan_pipeline
+import scanner_service
 from datetime import datetime
+from collections import OrderedDict
+from itertools import islice
+_IMPORTS_DONE = time.perf_counter()
+
+SEARCH_DISPLAY_LIMIT = 100 # Nombre max de résultats affichés sur l'écran de recherche
+LOG_STATUS_INTERVAL = 2 # secondes, rafraîchissement de l'état du journal
+SCAN_STATUS_INTERVAL = 0.5 # secondes, rafraîchissement du message "scan en cours"
 
 class ScanScreen(Screen):
     pass
@@ -47,35 +62,133 @@ class WarehouseApp(App):
     # 'WAITING_LOCATION_MOVE': Produit scanné (palette existante), attente scan nouvel emplacement pour déplacement
     # 'WAITING_LOT_DECISION': Lot existe, palette nouvelle, attente choix utilisateur (Ajouter palette au lot / Annuler)
     # 'WAITING_PALETTE_DELETE': Attente scan palette à supprimer
+    # 'RECEIVING': Réception continue, chaque nouveau QR produit s'ajoute au lot de réception
     current_state = StringProperty('IDLE')
     # Stocke temporairement les données du produit/palette scanné
     temp_product_data = ObjectProperty(None, allownone=True)
     # Stocke les données de la palette à supprimer (pour confirmation et logging)
     palette_to_delete_data = ObjectProperty(None, allownone=True)
+    # Étiquette d'emplacement lue dans la même image que le QR produit (None si absente)
+    paired_location_id = ObjectProperty(None, allownone=True)
     # Stocke les enregistrements existants si le lot est trouvé
     existing_lot_records = ObjectProperty(None, allownone=True)
+    # Requête de recherche en cours (annulée si une nouvelle recherche est lancée)
+    pending_search = ObjectProperty(None, allownone=True)
+    # Scan QR en cours (ScanFuture), None si aucun
+    pending_scan = ObjectProperty(None, allownone=True)
+    # Palettes lues en réception continue (OrderedDict palette -> données produit), None hors réception
+    receiving_batch = ObjectProperty(None, allownone=True)
+    # Événement d'annulation de l'export Excel en cours (None si aucun export)
+    export_cancel = ObjectProperty(None, allownone=True)
 
     def build(self):
-        # Initialiser DB et Excel au démarrage
-        try:
-            db_manager.init_db()
-            excel_manager.init_excel()
-            Logger.info("APP: Base de données et fichier Excel initialisés.")
-        except Exception as e:
-            Logger.error(f"APP: Erreur lors de l'initialisation DB/Excel: {e}")
-            # Afficher une erreur critique à l'utilisateur ici si nécessaire
+        self._startup_mark = _START_TIME
+        self.mark_startup("Imports", _IMPORTS_DONE)
+        # Tous les accès SQLite passent par ce thread: l'UI ne bloque jamais sur la base
+        self.db = db_worker.DatabaseWorker()
+        self.db.start()
+        # Initialiser la DB au démarrage (en premier dans la file du worker)
+        self.db.submit(db_manager.init_db, callback=self._on_db_ready, timeout=None)
+        # Capture et décodage QR sur un thread dédié: l'UI reste fluide pendant un scan.
+        # La caméra reste ouverte entre deux scans rapprochés (voir [scanner] idle_timeout)
+        camera_index = self.config.get('scanner', 'camera_index')
+        camera_session.configure_camera(int(camera_index) if camera_index.strip() else None,
+                                        self.config.getfloat('scanner', 'idle_timeout'))
+        decode_workers = self.config.get('scanner', 'decode_workers')
+        qr_scanner.DECODE_WORKERS = int(decode_workers) if decode_workers.strip() else None
+        qr_scanner.CPU_BUDGET = self.config.getfloat('scanner', 'cpu_budget')
+        self.scanner = scanner_service.ScannerService()
+        self.scanner.start()
+        # Journal des opérations: destinations choisies dans la configuration ([log] sinks).
+        # Un scan n'attend jamais le fichier Excel: xlsx passe par un spool écrit en arrière-plan
+        partition = self.config.get('log', 'partition').strip().lower()
+        if partition in excel_manager.PARTITION_FORMATS:
+            excel_manager.LOG_PARTITION = partition
+        else:
+            Logger.warning(f"APP: Partition du journal inconnue '{partition}', "
+                           f"'{excel_manager.LOG_PARTITION}' utilisée.")
+        self.log_sink = log_sinks.create_log_sink(self.config.get('log', 'sinks'))
+        self.log_sink.start()
+        self.mark_startup("Démarrage DB et journal (en arrière-plan)")
         self.title = "Gestion d'Entrepôt Pharma"
         sm = ScreenManager()
         sm.add_widget(ScanScreen(name='scan_screen'))
         sm.add_widget(SearchScreen(name='search_screen'))
         return sm
 
+    def build_config(self, config):
+        # sinks: 'csv', 'jsonl', 'xlsx' ou plusieurs séparés par des virgules (ex. 'csv,xlsx')
+        # partition: 'day', 'month' ou 'year' (un fichier journal par période)
+        config.setdefaults('log', {
+            'sinks': log_sinks.DEFAULT_SINKS,
+            'partition': excel_manager.LOG_PARTITION,
+        })
+        # camera_index: vide = essayer les caméras 0 puis 1 (l'index qui fonctionne est mémorisé)
+        # idle_timeout: secondes avant de fermer la caméra inutilisée (0 = après chaque scan)
+        # decode_workers: threads de décodage QR pendant un scan (vide = selon le nombre de cœurs)
+        # cpu_budget: cœurs CPU utilisés en moyenne par le décodage d'un scan (0.5 = un demi-cœur, 0 = sans limite;
+        # la capture n'est pas comptée). Sans limite par défaut: les décodeurs parallèles (decode_workers)
+        # occupent tous leurs cœurs et le QR est trouvé plus vite. Un budget économise la batterie ou laisse
+        # du CPU aux autres applications (terminaux partagés), mais au-dessous de decode_workers cœurs il
+        # annule une partie du gain des décodeurs parallèles
+        config.setdefaults('scanner', {
+            'camera_index': '',
+            'idle_timeout': camera_session.CAMERA_IDLE_TIMEOUT,
+            'decode_workers': '',
+            'cpu_budget': scan_pipeline.CPU_BUDGET,
+        })
+
+    def mark_startup(self, phase, now=None):
+        """Journalise la durée d'une phase du démarrage (depuis la phase précédente et depuis le lancement)."""
+        now = now or time.perf_counter()
+        Logger.info(f"STARTUP: {phase}: {(now - self._startup_mark) * 1000:.0f} ms "
+                    f"(total {(now - _START_TIME) * 1000:.0f} ms)")
+        self._startup_mark = now
+
     def on_start(self):
+        self.mark_startup("Construction de l'interface")
+        # Premier affichage de l'écran de scan, puis préchargement d'opencv/pyzbar hors du thread UI
+        Clock.schedule_once(self._on_first_frame)
         # S'assurer que l'état initial est correct au démarrage
         self.reset_state()
         # Demander les permissions sur Android au démarrage (meilleure pratique)
         if kivy_platform == 'android':
             self.request_android_permissions()
+        self.update_log_status()
+        Clock.schedule_interval(self.update_log_status, LOG_STATUS_INTERVAL)
+
+    def save_camera_index(self):
+        """Mémorise dans la configuration l'index de la caméra qui a fonctionné."""
+        camera_index = camera_session.get_camera_session().camera_index
+        if camera_index is not None and self.config.get('scanner', 'camera_index') != str(camera_index):
+            self.config.set('scanner', 'camera_index', str(camera_index))
+            self.config.write()
+
+    def _on_first_frame(self, dt):
+        self.mark_startup("Premier affichage")
+        threading.Thread(target=qr_scanner.preload_scanner_libraries, name='ScannerPreload', daemon=True).start()
+
+    def _on_db_ready(self, result, error):
+        if error:
+            Logger.error(f"APP: Erreur lors de l'initialisation DB: {error}")
+        else:
+            Logger.info(f"STARTUP: Base de données initialisée (total {(time.perf_counter() - _START_TIME) * 1000:.0f} ms).")
+
+    def on_stop(self):
+        # Terminer les requêtes en file puis fermer proprement les connexions persistantes
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+        self.scanner.stop()
+        camera_session.close_camera()
+        self.save_camera_index()
+        self.db.stop()
+        # Écrire les dernières lignes du journal en attente
+        if not self.log_sink.close():
+            Logger.warning(f"APP: {self.log_sink.pending_count()} enregistrement(s) du journal conservé(s) "
+                           "dans le spool pour le prochain démarrage.")
+        stats = db_manager.get_cache_stats()
+        Logger.info(f"APP: Cache DB: {stats['hits']} hit(s), {stats['misses']} miss(es) ({stats['hit_rate']:.0%}).")
+        db_manager.close_db()
 
     def request_android_permissions(self):
         try:
@@ -118,11 +231,30 @@ class WarehouseApp(App):
                 status_label.color = (1, 1, 1, 1) # Blanc (ou couleur par défaut)
         Logger.info(f"STATUS: {message}")
 
+    def update_log_status(self, *args):
+        """Affiche le nombre d'enregistrements du journal en attente d'écriture."""
+        scan_screen = self.root.get_screen('scan_screen')
+        if not scan_screen:
+            return
+        log_status_label = scan_screen.ids.log_status_label
+        pending = self.log_sink.pending_count()
+        retry_in = self.log_sink.retry_in()
+        if not pending:
+            log_status_label.text = "Journal à jour"
+            log_status_label.color = (0.7, 0.7, 0.7, 1) # Gris
+        elif retry_in:
+            log_status_label.text = f"Journal: {pending} en attente (fichier indisponible, nouvel essai dans {retry_in:.0f}s)"
+            log_status_label.color = (1, 0.6, 0, 1) # Orange
+        else:
+            log_status_label.text = f"Journal: {pending} en attente d'écriture"
+            log_status_label.color = (0.7, 0.7, 0.7, 1)
+
     def reset_state(self):
         """Réinitialise l'état de l'application."""
         self.current_state = 'IDLE'
         self.temp_product_data = None
         self.existing_lot_records = None # Reset existing lot records
+        self.paired_location_id = None
         scan_screen = self.root.get_screen('scan_screen')
         self.palette_to_delete_data = None # Reset delete data
         scan_screen = self.root.get_screen('scan_screen')
@@ -130,6 +262,8 @@ class WarehouseApp(App):
             scan_screen.ids.scan_product_button.disabled = False
             scan_screen.ids.scan_location_button.disabled = True
             scan_screen.ids.delete_palette_button.disabled = False # Enable delete button
+            scan_screen.ids.receive_button.disabled = False
+            scan_screen.ids.receive_button.text = "Réception continue"
             self.update_status("Prêt. Choisissez une action.")
 
     def show_popup(self, title, message):
@@ -159,22 +293,200 @@ class WarehouseApp(App):
             self.update_status("Erreur: Action précédente non terminée.", True)
             return
 
-        self.update_status("Scan du QR code Produit en cours...")
-        # Exécuter le scan dans un thread ou via Clock pour ne pas bloquer l'UI (surtout avec webcam)
-        # Ici, pour simplifier, appel direct (peut freezer sur Windows pendant le scan)
-        # Décider quelle fonction de scan appeler en fonction de l'état
+        # Le scan tourne sur le thread du ScannerService; suite dans le callback
+        # Décider quelle suite appeler en fonction de l'état
         if self.current_state == 'IDLE':
-            Clock.schedule_once(self._perform_product_scan_add_move, 0.1)
+            # Étiquettes produit et emplacement souvent visibles ensemble: les lire dans la même image
+            self.start_scan("Scan du QR code Produit", self._on_product_pair_scanned, pair=True)
         elif self.current_state == 'WAITING_PALETTE_DELETE':
-             Clock.schedule_once(self._perform_product_scan_delete, 0.1)
+             self.start_scan("Scan du QR code Palette à supprimer", self._on_palette_to_delete_scanned)
         else:
             self.update_status(f"Erreur: État inattendu {self.current_state} pour scan produit.", True)
 
+    def start_scan(self, description, on_result, pair=False):
+        """
+        Lance un scan QR en arrière-plan; on_result(qr_data, error) est appelé sur le thread UI.
+        pair=True: qr_data est (QR produit, ID emplacement), voir ScannerService.scan.
+        """
+        scan_screen = self.root.get_screen('scan_screen')
+        self._scan_buttons_state = {button_id: scan_screen.ids[button_id].disabled
+                                    for button_id in ('scan_product_button', 'scan_location_button',
+                                                      'delete_palette_button', 'receive_button')}
+        for button_id in self._scan_buttons_state:
+            scan_screen.ids[button_id].disabled = True # Pas de second scan pendant celui-ci
+        scan_screen.ids.cancel_scan_button.disabled = False
+        self._scan_description = description
+        self.pending_scan = self.scanner.scan(
+            lambda qr_data, error: self._on_scan_done(on_result, qr_data, error), pair=pair)
+        self._update_scan_status()
+        Clock.schedule_interval(self._update_scan_status, SCAN_STATUS_INTERVAL)
+
+    def _update_scan_status(self, *args):
+        if self.pending_scan is None:
+            return False # Arrêter le rafraîchissement
+        self.update_status(f"{self._scan_description} en cours... {self.pending_scan.elapsed():.0f}s "
+                           f"(max {self.pending_scan.timeout}s)")
+
+    def _end_scan(self):
+        """Restaure les boutons tels qu'avant le scan."""
+        Clock.unschedule(self._update_scan_status)
+        self.pending_scan = None
+        scan_screen = self.root.get_screen('scan_screen')
+        scan_screen.ids.cancel_scan_button.disabled = True
+        for button_id, disabled in self._scan_buttons_state.items():
+            scan_screen.ids[button_id].disabled = disabled
 
-    def _perform_product_scan_add_move(self, dt):
-        """Gère le scan produit pour l'ajout ou le déplacement."""
-        qr_data, error = qr_scanner.scan_qr_code()
+    def _on_scan_done(self, on_result, qr_data, error):
+        self._end_scan()
+        on_result(qr_data, error)
 
+    def cancel_scan(self):
+        """Annule le scan en cours (bouton Annuler): l'état de l'action en cours est conservé."""
+        if self.pending_scan is None:
+            return
+        self.pending_scan.cancel()
+        self._end_scan()
+        if self.current_state in ('WAITING_LOCATION_NEW', 'WAITING_LOCATION_MOVE'):
+            self.update_status("Scan annulé. Scannez l'emplacement pour continuer.")
+        else:
+            self.reset_state()
+            self.update_status("Scan annulé.")
+
+    def toggle_receiving(self):
+        """Démarre la réception continue, ou la termine et propose d'enregistrer le lot lu."""
+        if self.current_state == 'RECEIVING':
+            self._finish_receiving()
+            return
+        if self.current_state != 'IDLE' or self.pending_scan is not None:
+            self.update_status("Erreur: Action précédente non terminée.", True)
+            return
+        self.current_state = 'RECEIVING'
+        self.receiving_batch = OrderedDict()
+        self._receiving_invalid = 0
+        self._receiving_repeats = 0
+        scan_screen = self.root.get_screen('scan_screen')
+        for button_id in ('scan_product_button', 'scan_location_button', 'delete_palette_button'):
+            scan_screen.ids[button_id].disabled = True
+        scan_screen.ids.receive_button.text = "Terminer la réception"
+        # Pas de bouton Annuler ici: terminer la réception propose d'enregistrer ou d'abandonner le lot
+        self.pending_scan = self.scanner.scan_continuous(self._on_receiving_payload, self._on_receiving_stopped)
+        self.update_status("Réception continue: passez la caméra devant chaque palette.")
+
+    def _on_receiving_payload(self, qr_data):
+        """Un nouveau QR code lu en réception continue (déjà filtré des répétitions rapprochées)."""
+        if self.current_state != 'RECEIVING':
+            return
+        product_data, parse_error = qr_scanner.parse_product_qr(qr_data)
+        if parse_error:
+            self._receiving_invalid += 1
+            Logger.warning(f"APP: Réception: QR ignoré ({parse_error}): {qr_data}")
+            self.update_status(f"QR ignoré: {parse_error}", True)
+            return
+        palette_number = product_data['palette_number']
+        if palette_number in self.receiving_batch:
+            # Même palette relue après la fenêtre de dé-duplication
+            self._receiving_repeats += 1
+            return
+        self.receiving_batch[palette_number] = product_data
+        self.update_status(f"Réception: {len(self.receiving_batch)} palette(s) lue(s). "
+                           f"Dernière: {palette_number} ({product_data['product_name']})")
+
+    def _on_receiving_stopped(self, count, error):
+        """Le scan continu s'est arrêté de lui-même (inactivité, caméra indisponible)."""
+        self.pending_scan = None
+        if error:
+            Logger.warning(f"APP: Réception continue arrêtée: {error}")
+        self._finish_receiving(error)
+
+    def _finish_receiving(self, error=None):
+        """Arrête la caméra et demande confirmation avant d'enregistrer le lot lu."""
+        if self.pending_scan is not None:
+            self.pending_scan.cancel()
+            self.pending_scan = None
+        batch = list(self.receiving_batch.values())
+        ignored = f"{self._receiving_invalid} QR invalide(s), {self._receiving_repeats} relecture(s) ignorée(s)"
+        self.receiving_batch = None
+        self.reset_state()
+        if not batch:
+            self.update_status(f"Réception terminée: aucune palette lue ({error or ignored}).", bool(error))
+            return
+        text = (f"{len(batch)} palette(s) lue(s) ({ignored}).\n"
+                f"Enregistrer la réception ? Les palettes seront ajoutées sans emplacement.")
+        if error:
+            text = f"Réception arrêtée: {error}\n{text}"
+        self.update_status(f"Réception terminée: {len(batch)} palette(s) à confirmer.")
+        self.show_confirmation_popup(text, lambda: self._commit_receiving(batch))
+
+    def _commit_receiving(self, batch):
+        """Ajoute le lot reçu en une seule opération (rangement ensuite par déplacement)."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        products = [dict(product_data, location_id=None, timestamp=timestamp) for product_data in batch]
+        self.update_status(f"Enregistrement de {len(products)} palette(s) reçue(s)...")
+        self.root.get_screen('scan_screen').ids.receive_button.disabled = True # Pas de double envoi
+        self.db.submit(db_manager.add_palettes_bulk, products,
+                       callback=lambda results, error: self._on_receiving_committed(products, results, error),
+                       timeout=None)
+
+    def _on_receiving_committed(self, products, results, error):
+        if error:
+            self.update_status(f"Échec de l'enregistrement de la réception: {error}", True)
+            self.reset_state()
+            return
+        failures = []
+        for product_data, result in zip(products, results):
+            if result['status'] == db_manager.SCAN_OK:
+                self.log_sink.add(dict(product_data, id=result['id']), action='ADD')
+            else:
+                failures.append(f"{result['palette_number']}: {result['error']}")
+        added = len(products) - len(failures)
+        self.reset_state()
+        self.update_status(f"Réception enregistrée: {added} palette(s) ajoutée(s), {len(failures)} refusée(s).",
+                           bool(failures))
+        if failures:
+            shown = "\n".join(failures[:10])
+            more = f"\n... et {len(failures) - 10} autre(s)" if len(failures) > 10 else ""
+            self.show_popup("Réception: palettes refusées", shown + more)
+
+    def _on_product_pair_scanned(self, qr_data, error):
+        """Scan produit en mode paire: l'emplacement éventuellement lu dans la même image est gardé pour la suite."""
+        if error or not qr_data:
+            self._on_product_scanned(None, error)
+            return
+        product_qr, location_qr = qr_data
+        if not product_qr:
+            if location_qr:
+                self.update_status(f"QR emplacement '{location_qr}' lu sans QR produit. Scannez d'abord la palette.", True)
+            else:
+                self.update_status("Aucun QR code produit trouvé.", True)
+            self.reset_state()
+            return
+        self.paired_location_id = location_qr
+        self._on_product_scanned(product_qr, None)
+
+    def _paired_location_question(self):
+        """Complément des textes de confirmation quand un emplacement a été lu avec la palette."""
+        if not self.paired_location_id:
+            return ""
+        return (f"\nEmplacement lu avec la palette: '{self.paired_location_id}'.\n"
+                f"Confirmer l'enregistre directement à cet emplacement.")
+
+    def _use_paired_location(self, location_id=None):
+        """
+        Termine l'ajout/déplacement avec l'emplacement lu avec le produit (affiché dans la
+        confirmation qui précède). Retourne False s'il n'y en a pas.
+        """
+        if location_id is None:
+            location_id, self.paired_location_id = self.paired_location_id, None
+        if not location_id:
+            return False
+        Logger.info(f"APP: Emplacement '{location_id}' lu dans la même image que la palette.")
+        self.root.get_screen('scan_screen').ids.scan_location_button.disabled = True
+        # Emplacement occupé ou invalide: _on_location_scanned laisse le scan emplacement manuel disponible
+        self._on_location_scanned(location_id, None)
+        return True
+
+    def _on_product_scanned(self, qr_data, error):
+        """Gère le scan produit pour l'ajout ou le déplacement."""
         if error:
             self.update_status(f"Erreur scan produit: {error}", True)
             self.reset_state()
@@ -194,11 +506,20 @@ class WarehouseApp(App):
             return
 
         self.temp_product_data = product_data # Stocker les données lues pour ajout/déplacement
-        lot_number = product_data['lot_number']
-        palette_number = product_data['palette_number']
 
-        # Vérifier si le LOT existe déjà
-        self.existing_lot_records = db_manager.check_existing_lot(lot_number)
+        # Vérifier si le LOT existe déjà (en arrière-plan, suite dans _on_lot_checked)
+        self.db.submit(db_manager.check_existing_lot, product_data['lot_number'], callback=self._on_lot_checked)
+
+    def _on_lot_checked(self, existing_lot_records, error):
+        """Suite du scan produit (ajout/déplacement) une fois le lot vérifié en base."""
+        if error:
+            self.update_status(f"Erreur base de données: {error}", True)
+            self.reset_state()
+            return
+
+        self.existing_lot_records = existing_lot_records
+        lot_number = self.temp_product_data['lot_number']
+        palette_number = self.temp_product_data['palette_number']
 
         if self.existing_lot_records:
             Logger.info(f"APP: Lot {lot_number} existe déjà avec {len(self.existing_lot_records)} palette(s).")
@@ -211,9 +532,12 @@ class WarehouseApp(App):
                 current_location = existing_palette_record.get('location_id', 'N/A') if existing_palette_record else 'N/A'
                 Logger.info(f"APP: Palette {palette_number} (Lot {lot_number}) existe déjà à l'emplacement {current_location}.")
 
+                if self.paired_location_id:
+                    question = f"Voulez-vous la DÉPLACER vers l'emplacement '{self.paired_location_id}' (lu avec la palette) ?"
+                else:
+                    question = "Voulez-vous scanner un nouvel emplacement pour la DÉPLACER ?"
                 confirm_text = (f"Palette {palette_number} (Lot {lot_number})\n"
-                                f"existe déjà à l'emplacement '{current_location}'.\n\n"
-                                f"Voulez-vous scanner un nouvel emplacement pour la DÉPLACER ?")
+                                f"existe déjà à l'emplacement '{current_location}'.\n\n" + question)
 
                 # Utiliser un popup spécifique ou le générique avec le bon callback
                 self.show_confirmation_popup(
@@ -232,7 +556,8 @@ class WarehouseApp(App):
 
                 confirm_text = (f"Le Lot {lot_number} existe déjà (palette(s) à: {locations_str}).\n"
                                 f"La palette {palette_number} est nouvelle pour ce lot.\n\n"
-                                f"Voulez-vous AJOUTER cette nouvelle palette au lot ?")
+                                f"Voulez-vous AJOUTER cette nouvelle palette au lot ?"
+                                + self._paired_location_question())
 
                 # Afficher un popup demandant si on ajoute la nouvelle palette
                 # On réutilise show_confirmation_popup mais avec un callback différent
@@ -245,7 +570,15 @@ class WarehouseApp(App):
         else:
             # Cas 3: Le lot est entièrement nouveau. Préparer l'ajout directement.
             Logger.info(f"APP: Lot {lot_number} (Palette {palette_number}) est nouveau.")
+            # Emplacement lu avec la palette: le faire confirmer; Annuler laisse le scan emplacement manuel
+            location_id, self.paired_location_id = self.paired_location_id, None
             self.prepare_for_location_scan_new() # Préparer l'ajout
+            if location_id:
+                self.show_confirmation_popup(
+                    f"Ajouter la palette {palette_number} (nouveau lot {lot_number})\n"
+                    f"à l'emplacement '{location_id}' lu avec la palette ?\n\n"
+                    f"Annuler pour scanner un autre emplacement.",
+                    lambda: self._use_paired_location(location_id))
 
 
     def prepare_for_location_scan_new(self):
@@ -255,6 +588,7 @@ class WarehouseApp(App):
         scan_screen.ids.scan_product_button.disabled = True
         scan_screen.ids.scan_location_button.disabled = False
         self.update_status(f"Ajout palette {self.temp_product_data['palette_number']}. Scannez l'emplacement.")
+        self._use_paired_location()
 
     def prepare_for_location_scan_move(self):
         """Prépare l'état pour scanner le NOUVEL emplacement d'une palette EXISTANTE."""
@@ -263,6 +597,7 @@ class WarehouseApp(App):
         scan_screen.ids.scan_product_button.disabled = True
         scan_screen.ids.scan_location_button.disabled = False
         self.update_status(f"Déplacement palette {self.temp_product_data['palette_number']}. Scannez le nouvel emplacement.")
+        self._use_paired_location()
 
     def prepare_for_delete_scan(self):
         """Prépare l'état pour scanner la palette à supprimer."""
@@ -276,10 +611,8 @@ class WarehouseApp(App):
         scan_screen.ids.delete_palette_button.disabled = True # Désactiver pendant l'opération
         self.update_status("Prêt à supprimer. Scannez le QR de la palette livrée.")
 
-    def _perform_product_scan_delete(self, dt):
+    def _on_palette_to_delete_scanned(self, qr_data, error):
         """Gère le scan produit pour la suppression."""
-        qr_data, error = qr_scanner.scan_qr_code()
-
         if error:
             self.update_status(f"Erreur scan palette à supprimer: {error}", True)
             self.reset_state() # Retour à l'état initial en cas d'erreur
@@ -300,8 +633,16 @@ class WarehouseApp(App):
 
         palette_number_to_delete = product_data['palette_number']
 
-        # Vérifier si cette palette existe dans la DB
-        existing_palette_data = db_manager.check_existing_palette(palette_number_to_delete)
+        # Vérifier si cette palette existe dans la DB (suite dans _on_palette_to_delete_checked)
+        self.db.submit(db_manager.check_existing_palette, palette_number_to_delete,
+                       callback=lambda record, error: self._on_palette_to_delete_checked(palette_number_to_delete, record, error))
+
+    def _on_palette_to_delete_checked(self, palette_number_to_delete, existing_palette_data, error):
+        """Suite du scan de suppression une fois la palette recherchée en base."""
+        if error:
+            self.update_status(f"Erreur base de données: {error}", True)
+            self.reset_state()
+            return
 
         if existing_palette_data:
             self.palette_to_delete_data = existing_palette_data # Stocker les infos pour confirmation/log
@@ -327,20 +668,24 @@ class WarehouseApp(App):
         palette_number = self.palette_to_delete_data['palette_number']
         Logger.info(f"DELETE: Tentative de suppression de la palette {palette_number}")
 
-        # 1. Supprimer de la base de données
-        db_deleted = db_manager.delete_palette(palette_number)
+        # 1. Supprimer de la base de données (écriture: pas de délai d'annulation)
+        self.update_status(f"Suppression de la palette {palette_number}...")
+        self.db.submit(db_manager.delete_palette, palette_number,
+                       callback=lambda db_deleted, error: self._on_palette_deleted(palette_number, db_deleted), timeout=None)
 
+    def _on_palette_deleted(self, palette_number, db_deleted):
+        """Suite de la suppression une fois la transaction terminée."""
         if db_deleted:
-            # 2. Logger dans Excel
+            # 2. Enregistrer dans le journal
             # Ajouter timestamp de suppression
             self.palette_to_delete_data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            excel_logged = excel_manager.add_record_to_excel(self.palette_to_delete_data, action="DELETE")
+            logged = self.log_sink.add(self.palette_to_delete_data, action="DELETE")
 
-            if excel_logged:
+            if logged:
                 self.update_status(f"Succès: Palette {palette_number} supprimée (livrée).")
             else:
-                self.update_status(f"Succès DB, mais Erreur Excel lors de la suppression de {palette_number}.", True)
-                # Que faire ici ? La DB est modifiée mais pas Excel...
+                self.update_status(f"Succès DB, mais Erreur journal lors de la suppression de {palette_number}.", True)
+                # Que faire ici ? La DB est modifiée mais pas le journal...
         else:
             self.update_status(f"Échec: Erreur DB lors de la suppression de {palette_number}.", True)
 
@@ -353,13 +698,9 @@ class WarehouseApp(App):
             self.update_status("Erreur: Scannez d'abord un produit.", True)
             return
 
-        self.update_status("Scan du QR code Emplacement en cours...")
-        Clock.schedule_once(self._perform_location_scan, 0.1)
-
-
-    def _perform_location_scan(self, dt):
-        location_id, error = qr_scanner.scan_qr_code()
+        self.start_scan("Scan du QR code Emplacement", self._on_location_scanned)
 
+    def _on_location_scanned(self, location_id, error):
         if error:
             self.update_status(f"Erreur scan emplacement: {error}", True)
             # Ne pas reset complètement, permettre de réessayer le scan emplacement
@@ -383,17 +724,28 @@ class WarehouseApp(App):
                 scan_screen.ids.scan_location_button.disabled = False
             return
 
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        action = 'ADD' if self.current_state == 'WAITING_LOCATION_NEW' else 'MOVE'
+
+        # --- Vérifier l'occupation ET ajouter/déplacer en une seule transaction ---
+        # L'emplacement (normalisé) doit être libre, même s'il est occupé par la palette
+        # qu'on est en train de déplacer (pour forcer un emplacement vide).
+        self.update_status(f"Emplacement {original_location_id} (={normalized_location_id}) lu. Enregistrement...")
+        self.root.get_screen('scan_screen').ids.scan_location_button.disabled = True # Pas de double envoi
+        self.db.submit(db_manager.commit_scan, self.temp_product_data, normalized_location_id, timestamp, action,
+                       callback=lambda result, error: self._on_scan_committed(result, error, action, original_location_id, normalized_location_id),
+                       timeout=None)
+
+    def _on_scan_committed(self, result, error, action, original_location_id, normalized_location_id):
+        """Suite du scan d'emplacement une fois la transaction commit_scan terminée."""
         current_palette_number = self.temp_product_data['palette_number']
+        if error:
+            result = {'status': db_manager.SCAN_ERROR}
 
-        # --- Vérifier si l'emplacement (normalisé) est déjà occupé ---
-        occupying_palette = db_manager.get_palette_at_location(normalized_location_id) # Utiliser l'ID normalisé pour la vérification
-
-        # Modification: Empêcher l'ajout/déplacement vers TOUT emplacement occupé,
-        # même s'il est occupé par la palette qu'on est en train de déplacer (pour forcer un emplacement vide).
-        if occupying_palette is not None:
+        if result['status'] == db_manager.SCAN_OCCUPIED:
             # L'emplacement est occupé
             # Afficher l'ID original ou normalisé ? Utilisons l'original pour que l'utilisateur le reconnaisse.
-            error_msg = f"Emplacement {original_location_id} (={normalized_location_id}) déjà occupé par palette {occupying_palette}.\nVeuillez choisir un autre emplacement."
+            error_msg = f"Emplacement {original_location_id} (={normalized_location_id}) déjà occupé par palette {result['occupied_by']}.\nVeuillez choisir un autre emplacement."
             self.show_popup("Erreur Emplacement", error_msg)
             self.update_status(error_msg, True)
             # Laisser le bouton de scan emplacement actif pour réessayer
@@ -402,51 +754,21 @@ class WarehouseApp(App):
                 scan_screen.ids.scan_location_button.disabled = False
             return # Ne pas continuer
 
-        # --- Si l'emplacement est libre ---
-        # Afficher l'ID normalisé dans le message de statut pour confirmer ce qui est enregistré
-        self.update_status(f"Emplacement {original_location_id} (={normalized_location_id}) valide. Enregistrement...")
-
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # current_palette_number est déjà défini
-
         success = False
         action_description = ""
 
-        if self.current_state == 'WAITING_LOCATION_NEW':
-            # Ajouter la nouvelle palette (passer l'ID normalisé à la DB)
-            self.temp_product_data['location_id'] = normalized_location_id # Stocker l'ID normalisé
-            self.temp_product_data['timestamp'] = timestamp
-            db_success = db_manager.add_palette(self.temp_product_data)
-            if db_success:
-                # Récupérer l'ID de la DB pour l'Excel (optionnel mais bien)
-                new_record = db_manager.check_existing_palette(current_palette_number)
-                if new_record:
-                    self.temp_product_data['id'] = new_record['id']
-
-                # Utiliser l'ID normalisé aussi pour Excel pour la cohérence
-                excel_success = excel_manager.add_record_to_excel(self.temp_product_data, action="ADD")
-                success = excel_success # Considérer l'ajout Excel comme partie du succès global ?
+        if result['status'] == db_manager.SCAN_OK:
+            # L'enregistrement relu contient l'id DB, l'emplacement normalisé et le timestamp
+            logged = self.log_sink.add(result['record'], action=action)
+            success = logged # Considérer l'ajout au journal comme partie du succès global ?
+            if action == 'ADD':
                 action_description = f"Palette {current_palette_number} ajoutée à l'emplacement {normalized_location_id}."
             else:
-                action_description = f"Erreur DB lors de l'ajout de {current_palette_number}."
-
-        elif self.current_state == 'WAITING_LOCATION_MOVE':
-            # Mettre à jour l'emplacement de la palette existante (passer l'ID normalisé à la DB)
-            db_success = db_manager.update_palette_location(current_palette_number, normalized_location_id, timestamp)
-            if db_success:
-                 # Ajouter une ligne dans Excel pour l'historique de déplacement
-                 data_for_excel = self.temp_product_data.copy() # Copier les infos produit
-                 data_for_excel['location_id'] = normalized_location_id # Utiliser l'ID normalisé pour Excel
-                 data_for_excel['timestamp'] = timestamp
-                 # Essayer de récupérer l'ID DB existant
-                 existing = db_manager.check_existing_palette(current_palette_number)
-                 if existing: data_for_excel['id'] = existing['id']
-
-                 excel_success = excel_manager.add_record_to_excel(data_for_excel, action="MOVE")
-                 success = excel_success # Considérer l'ajout Excel comme partie du succès global ?
-                 action_description = f"Palette {current_palette_number} déplacée vers {normalized_location_id}."
-            else:
-                action_description = f"Erreur DB lors du déplacement de {current_palette_number}."
+                action_description = f"Palette {current_palette_number} déplacée vers {normalized_location_id}."
+        elif action == 'ADD':
+            action_description = f"Erreur DB lors de l'ajout de {current_palette_number}."
+        else:
+            action_description = f"Erreur DB lors du déplacement de {current_palette_number}."
 
         if success:
             self.update_status(f"Succès: {action_description}")
@@ -468,35 +790,100 @@ class WarehouseApp(App):
             results_label.text = "[color=ff3333]Veuillez entrer un terme de recherche.[/color]"
             return
 
-        search_by = 'lot_number' if search_type_text == 'Numéro de Lot' else 'product_name'
+        search_by = {
+            'Numéro de Lot': 'lot_number',
+            'Nom du Produit': 'product_name',
+            'Tous les champs': 'all', # Produit, lot, palette et emplacement
+        }.get(search_type_text, 'product_name')
         results_label.text = f"Recherche en cours pour '{query}'..."
 
-        try:
-            results = db_manager.search_inventory(query, search_by)
-            if not results:
-                results_label.text = f"Aucun résultat trouvé pour '{query}'."
-            else:
-                formatted_results = f"[b]Résultats pour '{query}': ({len(results)} trouvé(s))[/b]\n\n"
-                for record in results:
-                    formatted_results += (
-                        f"--------------------\n"
-                        f"[b]Palette:[/b] {record['palette_number']}\n"
-                        f"[b]Produit:[/b] {record['product_name']}\n"
-                        f"[b]Lot:[/b] {record['lot_number']}\n"
-                        f"Emplacement: {record.get('location_id', 'N/A')}\n"
-                        f"Prix: {record.get('price', 'N/A')}\n"
-                        f"Expiration: {record.get('expiry_date', 'N/A')}\n"
-                        f"Boîtes/Colis: {record.get('boxes_per_package', 'N/A')}\n"
-                        f"Dernière MàJ: {record.get('timestamp', 'N/A')}\n\n"
-                    )
-                results_label.text = formatted_results
-                # Ajuster la hauteur du ScrollView si nécessaire (ou s'assurer que le Label le fait)
-                results_label.height = results_label.texture_size[1]
+        # Une recherche précédente encore en cours n'est plus utile
+        if self.pending_search is not None:
+            self.pending_search.cancel()
+        self.pending_search = self.db.submit(
+            load_search_results, query, search_by,
+            callback=lambda result, error: self._show_search_results(query, result, error))
+
+    def _show_search_results(self, query, result, error):
+        """Affiche les résultats de recherche (appelé sur le thread UI)."""
+        self.pending_search = None
+        results_label = self.root.get_screen('search_screen').ids.search_results_label
+        if error:
+            results_label.text = f"[color=ff3333]Erreur lors de la recherche: {error}[/color]"
+            Logger.error(f"SEARCH: Erreur pendant la recherche: {error}")
+            return
 
+        total, results = result
+        if not results:
+            results_label.text = f"Aucun résultat trouvé pour '{query}'."
+        else:
+            formatted_results = f"[b]Résultats pour '{query}': ({total} trouvé(s))[/b]\n"
+            if total > len(results):
+                formatted_results += f"({len(results)} premiers affichés, affinez la recherche)\n"
+            formatted_results += "\n"
+            for record in results:
+                formatted_results += (
+                    f"--------------------\n"
+                    f"[b]Palette:[/b] {record['palette_number']}\n"
+                    f"[b]Produit:[/b] {record['product_name']}\n"
+                    f"[b]Lot:[/b] {record['lot_number']}\n"
+                    f"Emplacement: {record.get('location_id', 'N/A')}\n"
+                    f"Prix: {record.get('price', 'N/A')}\n"
+                    f"Expiration: {record.get('expiry_date', 'N/A')}\n"
+                    f"Boîtes/Colis: {record.get('boxes_per_package', 'N/A')}\n"
+                    f"Dernière MàJ: {record.get('timestamp', 'N/A')}\n\n"
+                )
+            results_label.text = formatted_results
+            # Ajuster la hauteur du ScrollView si nécessaire (ou s'assurer que le Label le fait)
+            results_label.height = results_label.texture_size[1]
 
-        except Exception as e:
-            results_label.text = f"[color=ff3333]Erreur lors de la recherche: {e}[/color]"
-            Logger.error(f"SEARCH: Erreur pendant la recherche: {e}")
+
+    def toggle_export(self):
+        """Lance l'export Excel de la base, ou l'annule s'il est en cours."""
+        export_button = self.root.get_screen('search_screen').ids.export_button
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            export_button.text = "Annulation de l'export..."
+            return
+        self.export_cancel = threading.Event()
+        export_button.text = "Annuler l'export"
+        # Thread dédié: l'export lit par les connexions de lecture et ne bloque ni l'UI ni le DatabaseWorker
+        threading.Thread(target=self._run_export, args=(self.export_cancel,), name='ExcelExport', daemon=True).start()
+
+    def _run_export(self, cancel_event):
+        result = excel_manager.export_database_to_excel(
+            progress_callback=lambda written, total: Clock.schedule_once(
+                lambda dt: self._show_export_progress(written, total)),
+            cancel_event=cancel_event)
+        Clock.schedule_once(lambda dt: self._on_export_done(*result))
+
+    def _show_export_progress(self, written, total):
+        if self.export_cancel is None or self.export_cancel.is_set():
+            return
+        export_button = self.root.get_screen('search_screen').ids.export_button
+        percent = f" ({written * 100 // total}%)" if total else ""
+        export_button.text = f"Annuler l'export{percent}"
+
+    def _on_export_done(self, export_path, error):
+        self.export_cancel = None
+        search_screen = self.root.get_screen('search_screen')
+        search_screen.ids.export_button.text = "Exporter vers Excel"
+        if error:
+            search_screen.ids.search_results_label.text = f"[color=ff3333]{error}[/color]"
+        else:
+            search_screen.ids.search_results_label.text = f"Export terminé: {export_path}"
+
+
+def load_search_results(query, search_by):
+    """
+    Exécuté par le DatabaseWorker: total compté à part, puis seulement les premiers résultats
+    (les plus pertinents) lus page par page, pour garder une mémoire bornée. Retourne (total, résultats).
+    """
+    total = db_manager.count_search_results(query, search_by)
+    results = list(islice(db_manager.iter_search_inventory(query, search_by, ranked=True), SEARCH_DISPLAY_LIMIT))
+    if total is None:
+        total = len(results)
+    return total, results
 
 
 if __name__ == '__main__':
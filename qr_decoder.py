@@ -0,0 +1,170 @@
+# qr_decoder.py
+import time
+from collections import namedtuple
+from kivy.logger import Logger # Importer Logger
+
+# Largeurs de l'image réduite essayée avant la pleine résolution: la plus grande inférieure à la
+# largeur de l'image (640 pour une caméra HD, 320 pour une webcam en 640x480, résolution par défaut d'OpenCV)
+DOWNSCALE_WIDTHS = (320, 640)
+ROI_MARGIN = 0.5 # Agrandissement de la zone du dernier QR détecté (50% de sa taille de chaque côté)
+ROI_MAX_MISSES = 5 # Images sans détection dans la zone avant de l'abandonner
+ASSESS_WIDTH = 320 # Largeur de l'image réduite servant à évaluer rapidement l'image avant décodage
+DARK_THRESHOLD = 35 # Luminosité moyenne (0-255) sous laquelle l'image est trop sombre pour décoder
+BLUR_THRESHOLD = 20 # Variance du laplacien sous laquelle l'image est floue (ou sans aucun détail)
+
+# Qualité d'une image (QrDecoder.last_quality)
+FRAME_DARK = 'dark'
+FRAME_BLURRY = 'blurry'
+FRAME_EMPTY = 'empty' # Nette, mais aucun motif de repérage QR visible
+FRAME_CANDIDATE = 'candidate' # Motif de repérage visible ou QR décodé
+
+# rect: (left, top, width, height) en pixels de l'image d'origine
+DecodedSymbol = namedtuple('DecodedSymbol', ['data', 'rect'])
+
+class QrDecoder:
+    """
+    Décodage QR d'une image caméra, du moins coûteux au plus coûteux:
+      1. zone du dernier QR détecté (ROI), agrandie de roi_margin, en pleine résolution
+      2. image entière réduite à la plus grande largeur de downscale_widths inférieure à la sienne
+      3. image entière en pleine résolution
+    L'image est convertie en niveaux de gris une seule fois et zbar ne cherche que des QR codes.
+    Avec assess_frames, une évaluation rapide (image réduite à ASSESS_WIDTH) précède le décodage:
+    les images trop sombres ou floues ne sont pas décodées (sauf si un QR vient d'être vu) et
+    last_quality indique si un motif de repérage QR est visible (voir scan_pipeline.FramePacer).
+    Chaque appel à decode() mesure sa durée (last_latency_ms, stats()).
+    """
+
+    def __init__(self, downscale_widths=DOWNSCALE_WIDTHS, roi_margin=ROI_MARGIN, roi_max_misses=ROI_MAX_MISSES,
+                 assess_frames=True):
+        import cv2
+        from pyzbar import pyzbar
+        from pyzbar.pyzbar import ZBarSymbol
+        self._cv2 = cv2
+        self._pyzbar = pyzbar
+        self._symbols = [ZBarSymbol.QRCODE]
+        self.downscale_widths = sorted(downscale_widths)
+        self.roi_margin = roi_margin
+        self.roi_max_misses = roi_max_misses
+        self.assess_frames = assess_frames
+        self.roi = None # (left, top, right, bottom) dans l'image d'origine
+        self._roi_misses = 0
+        self.frames = 0
+        self.decoded_frames = 0
+        self.skipped_frames = 0 # Images non décodées car trop sombres ou floues
+        self.total_latency_ms = 0.0
+        self.last_latency_ms = 0.0
+        self.last_stage = None # Étape qui a trouvé le dernier QR ('roi', 'w320', 'w640', 'full')
+        self.last_quality = None # FRAME_* de la dernière image (None sans assess_frames)
+
+    def _zbar(self, gray, offset=(0, 0), scale=1.0):
+        symbols = []
+        for barcode in self._pyzbar.decode(gray, symbols=self._symbols):
+            try:
+                data = barcode.data.decode('utf-8')
+            except UnicodeDecodeError:
+                Logger.warning("SCANNER: QR code ignoré (contenu non UTF-8).")
+                continue
+            left, top, width, height = barcode.rect
+            symbols.append(DecodedSymbol(data, (
+                int(left / scale) + offset[0], int(top / scale) + offset[1],
+                int(width / scale), int(height / scale))))
+        return symbols
+
+    def assess(self, gray):
+        """Évaluation rapide d'une image en niveaux de gris: FRAME_DARK, FRAME_BLURRY, FRAME_EMPTY ou FRAME_CANDIDATE."""
+        cv2 = self._cv2
+        height, width = gray.shape[:2]
+        if width > ASSESS_WIDTH:
+            gray = cv2.resize(gray, (ASSESS_WIDTH, int(height * ASSESS_WIDTH / width)), interpolation=cv2.INTER_AREA)
+        if gray.mean() < DARK_THRESHOLD:
+            return FRAME_DARK
+        if cv2.Laplacian(gray, cv2.CV_64F).var() < BLUR_THRESHOLD:
+            return FRAME_BLURRY
+        # Motif de repérage: contour contenant un contour qui en contient un autre (carrés imbriqués)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        _, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[-2:]
+        if hierarchy is not None:
+            hierarchy = hierarchy[0]
+            for _, _, child, _ in hierarchy:
+                if child >= 0 and hierarchy[child][2] >= 0:
+                    return FRAME_CANDIDATE
+        return FRAME_EMPTY
+
+    def _stages(self, gray):
+        """Génère (nom, image, décalage, échelle) dans l'ordre d'essai."""
+        height, width = gray.shape[:2]
+        if self.roi is not None:
+            left, top, right, bottom = self.roi
+            yield 'roi', gray[top:bottom, left:right], (left, top), 1.0
+        target_width = max((target for target in self.downscale_widths if target < width), default=None)
+        if target_width is not None:
+            scale = target_width / width
+            small = self._cv2.resize(gray, (target_width, int(height * scale)), interpolation=self._cv2.INTER_AREA)
+            yield f'w{target_width}', small, (0, 0), scale
+        yield 'full', gray, (0, 0), 1.0
+
+    def _track(self, symbols, shape):
+        """Mémorise la zone englobant les QR trouvés, agrandie de roi_margin."""
+        height, width = shape[:2]
+        left = min(symbol.rect[0] for symbol in symbols)
+        top = min(symbol.rect[1] for symbol in symbols)
+        right = max(symbol.rect[0] + symbol.rect[2] for symbol in symbols)
+        bottom = max(symbol.rect[1] + symbol.rect[3] for symbol in symbols)
+        margin_x = int((right - left) * self.roi_margin)
+        margin_y = int((bottom - top) * self.roi_margin)
+        self.roi = (max(0, left - margin_x), max(0, top - margin_y),
+                    min(width, right + margin_x), min(height, bottom + margin_y))
+        self._roi_misses = 0
+
+    def decode(self, frame, min_symbols=1):
+        """
+        Décode une image (BGR ou niveaux de gris). Retourne la liste des DecodedSymbol (vide si aucun).
+        Les étapes suivantes ne sont essayées que si moins de min_symbols QR ont été trouvés
+        (min_symbols=2: étiquettes produit et emplacement attendues dans la même image); le
+        résultat de l'étape qui en a trouvé le plus est alors retenu.
+        """
+        start_time = time.perf_counter()
+        gray = frame if frame.ndim == 2 else self._cv2.cvtColor(frame, self._cv2.COLOR_BGR2GRAY)
+        symbols = []
+        self.last_stage = None
+        self.last_quality = self.assess(gray) if self.assess_frames else None
+        if self.last_quality in (FRAME_DARK, FRAME_BLURRY) and self.roi is None:
+            self.skipped_frames += 1
+            self._record(start_time, symbols)
+            return symbols
+        for stage, image, offset, scale in self._stages(gray):
+            if image.size == 0:
+                continue
+            stage_symbols = self._zbar(image, offset, scale)
+            if len(stage_symbols) > len(symbols):
+                symbols = stage_symbols
+                self.last_stage = stage
+            if len(symbols) >= min_symbols:
+                break
+        if symbols:
+            self._track(symbols, gray.shape)
+        elif self.roi is not None:
+            self._roi_misses += 1
+            if self._roi_misses >= self.roi_max_misses:
+                self.roi = None # QR sorti du champ: revenir à l'image entière
+        if symbols and self.assess_frames:
+            self.last_quality = FRAME_CANDIDATE
+        self._record(start_time, symbols)
+        return symbols
+
+    def _record(self, start_time, symbols):
+        self.last_latency_ms = (time.perf_counter() - start_time) * 1000
+        self.frames += 1
+        self.total_latency_ms += self.last_latency_ms
+        if symbols:
+            self.decoded_frames += 1
+
+    def stats(self):
+        """Statistiques depuis la création: images traitées, décodées, ignorées (sombres/floues), latence moyenne (ms)."""
+        return {
+            'frames': self.frames,
+            'decoded_frames': self.decoded_frames,
+            'skipped_frames': self.skipped_frames,
+            'mean_latency_ms': self.total_latency_ms / self.frames if self.frames else 0.0,
+            'last_latency_ms': self.last_latency_ms,
+        }
@@ -1,11 +1,74 @@
 # qr_scanner.py
 import platform
+import re
 import time
 import datetime # Ajout de l'import manquant
 from kivy.logger import Logger # Pour logguer les infos Kivy
 
+import camera_session
+import frame_sources
+import scan_pipeline
+
+SCAN_TIMEOUT = 10 # secondes, durée max d'un scan webcam
+SCAN_CANCELLED = "Scan annulé"
+DEDUP_WINDOW = 5 # secondes, mode continu: un même QR relu dans ce délai est ignoré
+CONTINUOUS_IDLE_TIMEOUT = 120 # secondes sans nouveau QR avant l'arrêt du mode continu
+PAIR_WAIT = 0.5 # secondes, mode paire: attente de l'étiquette d'emplacement après un QR produit seul
+DECODE_WORKERS = None # Threads de décodage par scan (None = scan_pipeline.DECODE_WORKERS)
+CPU_BUDGET = None # Cœurs CPU en moyenne pour le décodage d'un scan (None = scan_pipeline.CPU_BUDGET, 0 = sans limite)
+PRODUCT_FIELDS = 6 # Nombre de champs ';' d'un QR produit (voir parse_product_qr)
+# Étiquette d'emplacement acceptée en mode paire: code court, lettres/chiffres séparés par - . _ /
+# ou espace (ex. 'A-01-02', 'B.12.3'); exclut URL, texte libre et QR produit mal formé
+LOCATION_PATTERN = re.compile(r'^[A-Za-z0-9]+(?:[-._/ ][A-Za-z0-9]+)*$')
+LOCATION_MAX_LENGTH = 20 # caractères
+
+def is_product_payload(data):
+    """True si le contenu a le format d'un QR produit (6 champs séparés par ';')."""
+    return len(data.strip().split(';')) == PRODUCT_FIELDS
+
+def is_location_payload(data):
+    """True si le contenu ressemble à un ID d'emplacement (voir LOCATION_PATTERN)."""
+    data = data.strip()
+    return len(data) <= LOCATION_MAX_LENGTH and LOCATION_PATTERN.match(data) is not None
+
+def classify_payloads(payloads):
+    """
+    Sépare les contenus lus dans une même image en (QR produit, ID d'emplacement), None si absent.
+    Le premier QR produit est retenu. L'emplacement n'est retenu que s'il est le SEUL autre QR
+    de l'image et qu'il a le format d'un emplacement: avec plusieurs étiquettes d'emplacement en
+    vue (emplacements voisins), une URL fournisseur ou un QR produit mal formé, on ne peut pas
+    savoir lequel est le bon et l'emplacement sera scanné à part.
+    """
+    product_qr = next((data for data in payloads if is_product_payload(data)), None)
+    others = {data.strip() for data in payloads if not is_product_payload(data) and data.strip()}
+    location_qr = None
+    if len(others) == 1:
+        candidate = others.pop()
+        if is_location_payload(candidate):
+            location_qr = candidate
+    return product_qr, location_qr
+
+def log_scan_stats(title, stats):
+    """Journalise les statistiques d'un scan (voir scan_pipeline.ScanPipeline.stats)."""
+    cpu_seconds = stats['cpu_seconds'] + stats['capture_cpu_seconds']
+    cpu_share = cpu_seconds / stats['elapsed_seconds'] if stats['elapsed_seconds'] else 0.0
+    Logger.info(f"SCANNER: {title}: {stats['captured']} image(s) capturée(s), {stats['frames']} analysée(s) "
+                f"par {stats['workers']} décodeur(s) ({stats['skipped_frames']} sombre(s)/floue(s) ignorée(s), "
+                f"{stats['decoded_frames']} avec QR), décodage moyen {stats['mean_latency_ms']:.1f} ms/image, "
+                f"CPU {stats['cpu_seconds']:.2f}s (décodage) + {stats['capture_cpu_seconds']:.2f}s (capture) "
+                f"sur {stats['elapsed_seconds']:.1f}s ({cpu_share:.0%} d'un cœur).")
+
 # --- Implémentation Windows (Webcam) ---
-def scan_qr_windows():
+def scan_qr_windows(timeout=SCAN_TIMEOUT, cancel_event=None, pair=False, source=None):
+    """
+    Scan webcam bloquant (à appeler hors du thread UI). S'arrête au premier QR code, après
+    timeout secondes, ou dès que cancel_event (threading.Event) est positionné.
+    pair=True: tous les QR de l'image sont lus et le résultat est (QR produit, ID emplacement)
+    (voir classify_payloads). Le scan s'arrête dès qu'un QR produit est vu; si l'étiquette
+    d'emplacement n'est pas dans la même image, elle est encore attendue PAIR_WAIT secondes,
+    puis le résultat est (QR produit, None).
+    source: source d'images (voir frame_sources), caméra partagée par défaut.
+    """
     try:
         import cv2
         from pyzbar import pyzbar
@@ -13,73 +76,134 @@ def scan_qr_windows():
         Logger.error("SCANNER: Les bibliothèques 'opencv-python' et 'pyzbar' sont nécessaires sur Windows.")
         return None, "Bibliothèques manquantes: opencv-python, pyzbar"
 
-    # Essayer d'ouvrir la caméra avant (souvent index 0) puis la suivante
-    cap = None
-    preferred_camera_index = 0 # Indice préféré pour la caméra avant
-    fallback_camera_index = 1 # Indice de secours
-    Logger.info(f"SCANNER: Tentative d'ouverture de la caméra index {preferred_camera_index} (CAP_DSHOW)...")
-    cap = cv2.VideoCapture(preferred_camera_index, cv2.CAP_DSHOW)
-
-    if not cap or not cap.isOpened():
-        Logger.warning(f"SCANNER: Échec ouverture caméra index {preferred_camera_index}. Tentative avec index {fallback_camera_index}...")
-        cap = cv2.VideoCapture(fallback_camera_index, cv2.CAP_DSHOW)
-        if not cap or not cap.isOpened():
-             Logger.error(f"SCANNER: Impossible d'ouvrir les caméras index {preferred_camera_index} ou {fallback_camera_index}.")
-             return None, "Caméra inaccessible"
-        else:
-             Logger.info(f"SCANNER: Caméra index {fallback_camera_index} ouverte.")
-    else:
-        Logger.info(f"SCANNER: Caméra index {preferred_camera_index} ouverte.")
-
-
+    # Caméra gardée ouverte entre deux scans (fermée après un délai d'inactivité).
+    # Capture et décodage en parallèle: les décodeurs prennent toujours l'image la plus récente
+    camera = source or camera_session.get_camera_session()
     Logger.info("SCANNER: Recherche de QR code...")
     found = False
     qr_data = None
     error_msg = "Aucun QR code détecté"
+    product_qr = None
+    pair_deadline = None
 
     start_time = time.time()
-    timeout = 10 # secondes
-
-    while time.time() - start_time < timeout:
-        ret, frame = cap.read()
-        if not ret:
-            error_msg = "Erreur de lecture de la caméra"
-            break
-
-        # Détecter et décoder les QR codes
-        barcodes = pyzbar.decode(frame)
-        if barcodes:
-            for barcode in barcodes:
-                if barcode.type == 'QRCODE':
-                    qr_data = barcode.data.decode('utf-8')
-                    Logger.info(f"SCANNER: QR Code détecté: {qr_data}")
+    with scan_pipeline.ScanPipeline(camera, DECODE_WORKERS, 2 if pair else 1, CPU_BUDGET) as pipeline:
+        while time.time() - start_time < timeout or pair_deadline is not None:
+            if pair_deadline is not None and time.time() > pair_deadline:
+                Logger.info("SCANNER: Aucune étiquette d'emplacement visible avec le QR produit.")
+                qr_data = (product_qr, None)
+                found = True
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                error_msg = SCAN_CANCELLED
+                Logger.info("SCANNER: Scan annulé par l'utilisateur.")
+                break
+            # Une lecture en échec rouvre la caméra une fois avant d'abandonner (erreur transmise ici)
+            result = pipeline.next_result()
+            if result.error == frame_sources.END_OF_SOURCE:
+                # Enregistrement terminé: comme un scan sans QR (ou produit seul en mode paire)
+                if product_qr:
+                    qr_data = (product_qr, None)
                     found = True
-                    # Dessiner un rectangle autour (optionnel, pour debug visuel si affichage)
-                    # (x, y, w, h) = barcode.rect
-                    # cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    break # Prendre le premier QR code trouvé
-            if found:
                 break
+            if result.error:
+                error_msg = result.error
+                break
+            symbols = result.symbols
 
-        # cv2.imshow('QR Scanner - Appuyez sur Q pour quitter', frame) # Retiré car cause l'erreur OpenCV
-        # if cv2.waitKey(1) & 0xFF == ord('q'): # Retiré car lié à imshow
-        #     Logger.info("SCANNER: Scan annulé par l'utilisateur (touche Q).")
-        #     error_msg = "Scan annulé par l'utilisateur"
-        #     break
-
-        # Ajouter une petite pause si nécessaire pour éviter 100% CPU, bien que cap.read() puisse suffire
-        time.sleep(0.01)
-
+            # Premier décodage retenu: la sortie du bloc with arrête la capture et les autres décodeurs
+            if symbols and pair:
+                frame_product, location_qr = classify_payloads([symbol.data for symbol in symbols])
+                product_qr = frame_product or product_qr
+                if product_qr and location_qr:
+                    qr_data = (product_qr, location_qr)
+                    found = True
+                    Logger.info(f"SCANNER: QR produit et emplacement '{location_qr}' détectés (image {result.frame}, "
+                                f"étape '{result.stage}', {len(symbols)} QR, {result.latency_ms:.1f} ms, "
+                                f"{time.time() - start_time:.2f}s)")
+                    break
+                if product_qr and pair_deadline is None:
+                    pair_deadline = time.time() + PAIR_WAIT
+            elif symbols:
+                qr_data = symbols[0].data # Prendre le premier QR code trouvé
+                found = True
+                Logger.info(f"SCANNER: QR Code détecté: {qr_data} (image {result.frame}, "
+                            f"étape '{result.stage}', {result.latency_ms:.1f} ms, {time.time() - start_time:.2f}s)")
+                break
 
-    cap.release()
-    # cv2.destroyAllWindows() # Retiré car lié à imshow
-    Logger.info("SCANNER: Caméra fermée.")
+    log_scan_stats("Scan terminé", pipeline.stats())
 
     if found:
         return qr_data, None
     else:
         return None, error_msg
 
+class RecentPayloads:
+    """
+    Filtre des lectures répétées: un contenu déjà vu il y a moins de window secondes est
+    ignoré (et son horodatage rafraîchi, pour qu'un QR qui reste dans le champ ne soit
+    signalé qu'une fois).
+    """
+
+    def __init__(self, window=DEDUP_WINDOW):
+        self.window = window
+        self._last_seen = {} # contenu -> time.monotonic() de la dernière lecture
+
+    def is_new(self, payload, now=None):
+        now = time.monotonic() if now is None else now
+        last_seen = self._last_seen.get(payload)
+        self._last_seen[payload] = now
+        if len(self._last_seen) > 1000:
+            # Oublier les contenus sortis de la fenêtre (mémoire bornée sur une longue session)
+            self._last_seen = {data: seen for data, seen in self._last_seen.items() if now - seen < self.window}
+        return last_seen is None or now - last_seen >= self.window
+
+def scan_qr_continuous(on_payload, cancel_event, dedup_window=DEDUP_WINDOW, idle_timeout=CONTINUOUS_IDLE_TIMEOUT,
+                       source=None):
+    """
+    Mode continu (webcam): la caméra reste active et chaque nouveau QR code détecté (tous les
+    QR de chaque image) est transmis à on_payload(contenu), appelé sur le thread de capture.
+    Les répétitions dans la fenêtre dedup_window sont ignorées. S'arrête quand cancel_event
+    est positionné ou après idle_timeout secondes sans nouveau QR code.
+    Retourne (nombre de QR transmis, None) ou (nombre, message d'erreur).
+    source: source d'images (voir frame_sources), caméra partagée par défaut.
+    """
+    if source is None and not uses_webcam():
+        return 0, "Mode continu disponible uniquement avec une webcam"
+    try:
+        import cv2
+        from pyzbar import pyzbar
+    except ImportError:
+        Logger.error("SCANNER: Les bibliothèques 'opencv-python' et 'pyzbar' sont nécessaires pour le mode continu.")
+        return 0, "Bibliothèques manquantes: opencv-python, pyzbar"
+
+    camera = source or camera_session.get_camera_session()
+    Logger.info("SCANNER: Mode continu démarré.")
+    recent = RecentPayloads(dedup_window)
+    count = 0
+    error_msg = None
+    last_new = time.time()
+
+    with scan_pipeline.ScanPipeline(camera, DECODE_WORKERS, cpu_budget=CPU_BUDGET) as pipeline:
+        while not cancel_event.is_set():
+            if time.time() - last_new > idle_timeout:
+                error_msg = f"Aucun nouveau QR code depuis {idle_timeout}s"
+                break
+            result = pipeline.next_result()
+            if result.error:
+                if result.error != frame_sources.END_OF_SOURCE:
+                    error_msg = result.error
+                break
+            for symbol in result.symbols or ():
+                if recent.is_new(symbol.data):
+                    count += 1
+                    last_new = time.time()
+                    Logger.info(f"SCANNER: QR Code détecté (mode continu, n°{count}): {symbol.data}")
+                    on_payload(symbol.data)
+
+    log_scan_stats(f"Mode continu terminé ({count} QR code(s))", pipeline.stats())
+    return count, error_msg
+
 # --- Implémentation Android (Utilisation de Plyer ou Pyjnius/ZXing) ---
 def scan_qr_android():
     # Méthode 1: Utilisation de Plyer (plus simple si disponible et suffisant)
@@ -113,21 +237,48 @@ def scan_qr_android():
     # return None, "Scan Android non implémenté (Pyjnius)"
 
 
+def uses_webcam():
+    """True si le scan passe par la webcam (opencv + pyzbar) sur cette plateforme."""
+    from kivy.utils import platform as kivy_platform
+    return kivy_platform != 'android' and platform.system() in ("Windows", "Linux", "Darwin")
+
+def preload_scanner_libraries():
+    """
+    Importe opencv et pyzbar à l'avance (à appeler hors du thread UI, après le premier affichage):
+    le premier scan n'attend pas leur chargement. Sans effet si le scan n'utilise pas la webcam.
+    """
+    if not uses_webcam():
+        return
+    start_time = time.perf_counter()
+    try:
+        import cv2
+        from pyzbar import pyzbar
+    except ImportError:
+        Logger.warning("SCANNER: Préchargement impossible: opencv-python ou pyzbar absent.")
+        return
+    Logger.info(f"STARTUP: Bibliothèques de scan chargées en {(time.perf_counter() - start_time) * 1000:.0f} ms.")
+
 # --- Fonction principale de scan ---
-def scan_qr_code():
-    """Lance le scan QR adapté à la plateforme."""
+def scan_qr_code(timeout=SCAN_TIMEOUT, cancel_event=None, pair=False):
+    """
+    Lance le scan QR adapté à la plateforme (bloquant: voir scanner_service pour l'UI).
+    timeout et cancel_event ne s'appliquent qu'au scan webcam; le scan Android (Plyer)
+    ouvre une activité externe que l'utilisateur ferme lui-même.
+    pair=True: résultat (QR produit, ID emplacement), voir scan_qr_windows. Plyer ne
+    retourne qu'un QR: il est classé comme produit ou comme emplacement.
+    """
     os_name = platform.system()
     Logger.info(f"SCANNER: Détection de la plateforme: {os_name}")
 
     if os_name == "Windows":
-        return scan_qr_windows()
+        return scan_qr_windows(timeout, cancel_event, pair)
     elif os_name == "Linux":
          # Linux peut utiliser la même méthode que Windows si webcam et libs sont installées
          Logger.warning("SCANNER: Utilisation de la méthode Windows/Webcam pour Linux.")
-         return scan_qr_windows()
+         return scan_qr_windows(timeout, cancel_event, pair)
     elif platform.system() == "Darwin": # macOS
          Logger.warning("SCANNER: Utilisation de la méthode Windows/Webcam pour macOS.")
-         return scan_qr_windows()
+         return scan_qr_windows(timeout, cancel_event, pair)
     else:
         # Supposons Android si ce n'est pas Windows/Linux/macOS (à affiner si nécessaire)
         # Vérification plus robuste possible via os.environ ou kivy.utils.platform
@@ -145,7 +296,10 @@ def scan_qr_code():
             except Exception as e:
                  Logger.error(f"SCANNER: Erreur lors de la demande de permission caméra: {e}")
 
-            return scan_qr_android()
+            qr_data, error = scan_qr_android()
+            if pair and qr_data:
+                return classify_payloads([qr_data]), None
+            return qr_data, error
         else:
             Logger.error(f"SCANNER: Plateforme '{os_name}' / '{kivy_platform}' non supportée pour le scan QR.")
             return None, f"Plateforme non supportée: {kivy_platform}"
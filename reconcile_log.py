@@ -0,0 +1,203 @@
+# reconcile_log.py
+"""
+Compare le journal des opérations à la table inventory.
+
+Le journal est relu en flux, dans l'ordre chronologique des fichiers, au format configuré
+dans l'application ([log] sinks de warehouse.ini, sinon --source): pour csv et jsonl,
+l'historique Excel d'avant le changement de format (warehouse_log.xlsx, ses partitions et le
+spool) est relu d'abord, puis les partitions CSV/JSONL, comme un seul historique. Les
+opérations ADD/MOVE/DELETE sont rejouées pour reconstruire l'inventaire attendu
+(palette -> emplacement), puis comparées à la base:
+    MANQUANTE   palette présente d'après le journal mais absente de la base
+    EN_TROP     palette présente dans la base mais absente d'après le journal
+    MAL_PLACEE  palette présente des deux côtés, à des emplacements différents
+La mémoire utilisée dépend du nombre de palettes en stock, pas de la longueur du journal.
+Rejouer une partie de l'historique deux fois (journal Excel et CSV tenus en même temps) ne
+change pas le résultat: la dernière opération de chaque palette reste la même.
+
+Usage:
+    python reconcile_log.py
+    python reconcile_log.py --source csv --log-dir /chemin/journal --db /chemin/database.db
+    python reconcile_log.py --config /chemin/warehouse.ini
+    python reconcile_log.py --output ecarts.csv
+"""
+import os
+# Empêcher Kivy d'interpréter les arguments de la ligne de commande
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+import argparse
+import configparser
+import csv
+import json
+import sys
+import time
+
+import db_manager
+import excel_manager
+import log_sinks
+
+PROGRESS_ROWS = 100000 # Afficher l'avancement toutes les N lignes lues
+CONFIG_FILE_NAME = 'warehouse.ini' # Configuration de l'application (Kivy, à côté de main.py)
+MISSING = 'MANQUANTE'
+EXTRA = 'EN_TROP'
+MISPLACED = 'MAL_PLACEE'
+
+def _iter_xlsx(path):
+    import openpyxl # Seulement s'il existe un journal Excel à relire
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        yield from workbook[excel_manager.SHEET_NAME].iter_rows(min_row=2, values_only=True)
+    finally:
+        workbook.close()
+
+def _iter_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = csv.reader(f, delimiter=log_sinks.CSV_DELIMITER)
+        next(rows, None) # En-têtes
+        yield from rows
+
+def _iter_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # Ligne tronquée par un arrêt brutal
+            yield tuple(record.get(field) for field in log_sinks.LOG_FIELDS)
+
+def _iter_spool(path):
+    # Le spool contient des listes dans l'ordre des en-têtes
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+_READERS = {'xlsx': _iter_xlsx, 'csv': _iter_csv, 'jsonl': _iter_jsonl}
+
+def configured_source(config_path=None):
+    """
+    Format du journal configuré dans l'application: première destination connue de [log] sinks
+    (voir log_sinks.create_log_sink), log_sinks.DEFAULT_SINKS si le fichier ou la clé manque.
+    """
+    config_path = config_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), CONFIG_FILE_NAME)
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(config_path, encoding='utf-8')
+    sinks = config.get('log', 'sinks', fallback=log_sinks.DEFAULT_SINKS)
+    for name in (part.strip().lower() for part in sinks.split(',')):
+        if name in _READERS:
+            return name
+    return log_sinks.DEFAULT_SINKS.split(',')[0]
+
+def _iter_files(source, log_dir):
+    for path in excel_manager.list_log_files(log_dir, source):
+        print(f"Lecture de {os.path.basename(path)}...", file=sys.stderr)
+        yield from _READERS[source](path)
+
+def iter_log_rows(source=None, log_dir=None, include_spool=True):
+    """
+    Génère les lignes du journal (ordre de excel_manager.HEADERS), fichier par fichier,
+    du plus ancien au plus récent. source: voir configured_source (défaut). L'historique Excel
+    vient toujours en premier, suivi des lignes encore dans son spool (pas encore écrites dans
+    les classeurs); pour 'csv' et 'jsonl', les partitions de ce format suivent.
+    """
+    source = source or configured_source()
+    log_dir = log_dir or excel_manager.get_log_dir()
+    yield from _iter_files('xlsx', log_dir)
+    spool_path = os.path.join(log_dir, excel_manager.SPOOL_FILE_NAME)
+    if include_spool and os.path.exists(spool_path):
+        print(f"Lecture de {excel_manager.SPOOL_FILE_NAME}...", file=sys.stderr)
+        yield from _iter_spool(spool_path)
+    if source != 'xlsx':
+        yield from _iter_files(source, log_dir)
+
+def _normalize(location_id):
+    # Palette sans emplacement: None en base, '' dans le journal CSV, 'N/A' dans les anciens journaux
+    if location_id is None or str(location_id).strip() in ('', 'N/A'):
+        return None
+    return db_manager.normalize_location_id(location_id) or None
+
+def replay_log(rows):
+    """Rejoue ADD/MOVE/DELETE et retourne (inventaire attendu {palette: emplacement}, lignes lues)."""
+    expected = {}
+    count = 0
+    for row in rows:
+        count += 1
+        if count % PROGRESS_ROWS == 0:
+            print(f"{count} ligne(s) lue(s)...", file=sys.stderr)
+        if not row or len(row) < len(excel_manager.HEADERS):
+            continue
+        action, palette_number = row[1], row[3]
+        if palette_number in (None, 'N/A'):
+            continue
+        palette_number = str(palette_number)
+        if action in ('ADD', 'MOVE'):
+            expected[palette_number] = _normalize(row[9])
+        elif action == 'DELETE':
+            expected.pop(palette_number, None)
+    return expected, count
+
+def diff_inventory(expected):
+    """
+    Compare l'inventaire attendu à la base (lue page par page) et génère
+    (type d'écart, palette, emplacement attendu, emplacement en base). Vide expected.
+    """
+    for record in db_manager.iter_inventory():
+        palette_number = str(record.palette_number)
+        if palette_number not in expected:
+            yield EXTRA, palette_number, None, record.location_id
+            continue
+        expected_location = expected.pop(palette_number)
+        if expected_location != _normalize(record.location_id):
+            yield MISPLACED, palette_number, expected_location, record.location_id
+    for palette_number, expected_location in sorted(expected.items()):
+        yield MISSING, palette_number, expected_location, None
+
+def reconcile(source=None, log_dir=None, output=None, include_spool=True):
+    """Affiche (ou écrit en CSV dans output) les écarts. Retourne le nombre d'écarts par type."""
+    start_time = time.time()
+    expected, row_count = replay_log(iter_log_rows(source, log_dir, include_spool))
+    print(f"{row_count} ligne(s) de journal rejouée(s), {len(expected)} palette(s) attendue(s) en stock.",
+          file=sys.stderr)
+    counts = {MISSING: 0, EXTRA: 0, MISPLACED: 0}
+    out = open(output, 'w', newline='', encoding='utf-8-sig') if output else sys.stdout
+    try:
+        writer = csv.writer(out, delimiter=log_sinks.CSV_DELIMITER)
+        writer.writerow(['Ecart', 'Palette', 'Emplacement journal', 'Emplacement base'])
+        for kind, palette_number, expected_location, db_location in diff_inventory(expected):
+            counts[kind] += 1
+            writer.writerow([kind, palette_number, expected_location or '', db_location or ''])
+    finally:
+        if output:
+            out.close()
+    summary = ", ".join(f"{kind}: {count}" for kind, count in counts.items())
+    print(f"Réconciliation terminée en {time.time() - start_time:.1f}s ({summary}).", file=sys.stderr)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare le journal des opérations à l'inventaire en base.")
+    parser.add_argument('--source', choices=sorted(_READERS),
+                        help="Format du journal à relire, après l'historique Excel "
+                             "(défaut: [log] sinks de la configuration)")
+    parser.add_argument('--config', help=f"Configuration de l'application (défaut: {CONFIG_FILE_NAME} "
+                                         "à côté de ce script)")
+    parser.add_argument('--log-dir', help="Répertoire des fichiers du journal (défaut: répertoire de l'application)")
+    parser.add_argument('--db', help="Chemin de la base (défaut: base de l'application)")
+    parser.add_argument('--output', help="Fichier CSV des écarts (défaut: sortie standard)")
+    parser.add_argument('--no-spool', action='store_true', help="Ignorer les lignes xlsx encore dans le spool")
+    args = parser.parse_args(argv)
+    source = args.source or configured_source(args.config)
+    print(f"Journal relu: {source}", file=sys.stderr)
+
+    if args.db:
+        db_manager.open_db(args.db)
+    db_manager.init_db()
+    try:
+        counts = reconcile(source, args.log_dir, args.output, not args.no_spool)
+    finally:
+        db_manager.close_db()
+    return 1 if any(counts.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
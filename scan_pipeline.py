@@ -0,0 +1,266 @@
+# scan_pipeline.py
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from kivy.logger import Logger # Importer Logger
+
+import qr_decoder
+
+# Threads de décodage: zbar et opencv libèrent le GIL pendant le calcul. Un cœur reste
+# libre pour la capture et l'interface.
+DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1)) # Valeur par défaut si non configurée
+WAIT_INTERVAL = 0.1 # secondes, attente max d'une image ou d'un résultat avant de revérifier l'arrêt
+# Temps CPU moyen du décodage, en cœurs (0.5 = un demi-cœur, 0 = sans limite). Sans limite par
+# défaut: un budget inférieur à DECODE_WORKERS cœurs plafonne le gain des décodeurs parallèles
+CPU_BUDGET = 0
+MAX_BUDGET_DELAY = 1.0 # secondes, attente max imposée par le budget CPU: au moins un décodage par seconde
+MIN_FRAME_INTERVAL = 0.0 # secondes entre deux décodages quand un QR est en vue
+BACKOFF_INTERVAL = 0.05 # secondes, premier ralentissement après une image sans intérêt (doublé ensuite)
+MAX_FRAME_INTERVAL = 0.4 # secondes entre deux décodages au plus lent (image sombre, floue, sans QR)
+
+class FramePacer:
+    """
+    Rythme des décodages, partagé par les décodeurs d'un scan. Après une image sombre, floue
+    ou sans motif de repérage, l'intervalle entre deux décodages double (jusqu'à max_interval);
+    dès qu'un QR ou un motif de repérage apparaît, il revient à min_interval. En plus, le temps
+    CPU du décodage est gardé sous cpu_budget cœur(s) en moyenne depuis le début du scan: un
+    décodage attend le temps nécessaire pour revenir sous le budget, sans dépasser
+    MAX_BUDGET_DELAY (le scan doit continuer à décoder même si un décodage coûte plus que le
+    budget). Le temps CPU de la capture est compté à part (capture_cpu_seconds) et non limité:
+    la caméra produit ses images de toute façon, et le freiner ne ferait qu'ajouter du retard
+    sans rendre de temps aux décodeurs.
+    """
+
+    def __init__(self, cpu_budget=CPU_BUDGET, min_interval=MIN_FRAME_INTERVAL, max_interval=MAX_FRAME_INTERVAL):
+        self.cpu_budget = cpu_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.cpu_seconds = 0.0 # Temps CPU des threads de décodage (compté dans le budget)
+        self.capture_cpu_seconds = 0.0 # Temps CPU du thread de capture (hors budget)
+        self.waited_seconds = 0.0 # Attente cumulée imposée aux décodeurs
+        self._lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._next_time = self._start_time
+
+    def add_cpu(self, seconds):
+        with self._lock:
+            self.cpu_seconds += seconds
+
+    def add_capture_cpu(self, seconds):
+        with self._lock:
+            self.capture_cpu_seconds += seconds
+
+    def _delay(self, now):
+        budget_delay = 0.0
+        if self.cpu_budget:
+            # Instant où le temps CPU consommé correspondra au budget
+            budget_delay = min(MAX_BUDGET_DELAY, self._start_time + self.cpu_seconds / self.cpu_budget - now)
+        return max(self.interval, budget_delay)
+
+    def update(self, quality):
+        """Ajuste l'intervalle selon la qualité (qr_decoder.FRAME_*) de l'image qui vient d'être décodée."""
+        with self._lock:
+            if quality in (None, qr_decoder.FRAME_CANDIDATE):
+                self.interval = self.min_interval
+                # Un décodeur qui attend repart sans délai (sous réserve du budget CPU)
+                now = time.monotonic()
+                self._next_time = min(self._next_time, now + self._delay(now))
+            else:
+                self.interval = min(self.max_interval, max(BACKOFF_INTERVAL, self.interval * 2))
+
+    def wait(self, stop_event):
+        """Attend le prochain créneau de décodage et le réserve. Retourne False si stop_event est positionné."""
+        while not stop_event.is_set():
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._next_time:
+                    self._next_time = now + self._delay(now)
+                    return True
+                delay = self._next_time - now
+            waited = time.monotonic()
+            stop_event.wait(min(delay, WAIT_INTERVAL))
+            with self._lock:
+                self.waited_seconds += time.monotonic() - waited
+        return False
+
+    def elapsed(self):
+        return time.monotonic() - self._start_time
+
+# Résultat de next_result(): QR d'une image décodée (avec numéro d'image, étape et durée du
+# décodage), ou erreur de la source (error), ou rien avant le délai d'attente (tout à None)
+DecodeResult = namedtuple('DecodeResult', ['symbols', 'error', 'frame', 'stage', 'latency_ms'])
+_NO_RESULT = DecodeResult(None, None, None, None, None)
+
+class LatestFrame:
+    """
+    Tampon d'une seule image: la capture remplace l'image que personne n'a encore prise,
+    les décodeurs travaillent donc toujours sur l'image la plus récente. Pour une source
+    enregistrée non cadencée, put(block=True) attend au contraire que l'image soit prise.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._sequence = 0
+        self.dropped = 0 # Images remplacées avant d'avoir été décodées
+        self.closed = False
+
+    def put(self, frame, block=False):
+        with self._condition:
+            while block and self._frame is not None and not self.closed:
+                self._condition.wait(WAIT_INTERVAL)
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def get(self, timeout=WAIT_INTERVAL):
+        """Retourne (numéro, image) et vide le tampon, ou None si rien n'arrive avant timeout ou après close()."""
+        with self._condition:
+            if self._frame is None and not self.closed:
+                self._condition.wait(timeout)
+            if self._frame is None:
+                return None
+            frame, self._frame = self._frame, None
+            self._condition.notify_all() # Capture en attente de place (put bloquant)
+            return self._sequence, frame
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+class ScanPipeline:
+    """
+    Capture et décodage en parallèle: un thread lit la source (caméra ou enregistrement, voir
+    frame_sources) dans un LatestFrame, workers threads la décodent, chacun avec son QrDecoder,
+    au rythme fixé par un FramePacer (ralenti sur les images sans intérêt, borné par cpu_budget).
+    Les images décodées avec au moins un QR sont mises à disposition via next_result().
+    Le premier résultat retenu par l'appelant termine le scan: stop() arrête la capture et les
+    décodeurs (un décodage en cours s'achève, son résultat est ignoré).
+    Le thread de capture utilise la source entre start() et stop() (with source: ...).
+    Une source enregistrée non cadencée (live=False, voir frame_sources) n'avance que quand
+    l'image précédente a été prise: toutes ses images sont décodées.
+    """
+
+    def __init__(self, source, workers=None, min_symbols=1, cpu_budget=None):
+        self.source = source
+        self.workers = workers or DECODE_WORKERS
+        self.min_symbols = min_symbols
+        cpu_budget = CPU_BUDGET if cpu_budget is None else cpu_budget
+        if getattr(source, 'live', True):
+            self.pacer = FramePacer(cpu_budget)
+        else:
+            # Source qui attend les décodeurs: pas d'image perdue à éviter, donc pas de ralentissement
+            self.pacer = FramePacer(cpu_budget, max_interval=MIN_FRAME_INTERVAL)
+        self.frames = LatestFrame()
+        self.captured = 0
+        self._decoders = []
+        self._results = queue.Queue()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._workers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        for index in range(self.workers):
+            decoder = qr_decoder.QrDecoder()
+            self._decoders.append(decoder)
+            self._workers.append(threading.Thread(target=self._decode, args=(decoder,),
+                                                  name=f'ScanDecode-{index}', daemon=True))
+        self._threads = [threading.Thread(target=self._capture, name='ScanCapture', daemon=True)] + self._workers
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        self.frames.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _capture(self):
+        error = None
+        try:
+            with self.source:
+                error = self.source.open()
+                while not error and not self._stop_event.is_set():
+                    cpu_start = time.thread_time()
+                    frame, error = self.source.read()
+                    self.pacer.add_capture_cpu(time.thread_time() - cpu_start)
+                    if frame is not None:
+                        self.captured += 1
+                        self.frames.put(frame, block=not getattr(self.source, 'live', True))
+        except Exception as e:
+            Logger.error(f"SCANNER: Erreur inattendue pendant la capture: {e}")
+            error = f"Erreur de capture: {e}"
+        finally:
+            self.frames.close()
+        if error:
+            # Laisser les décodeurs finir la dernière image avant de signaler l'erreur
+            for thread in self._workers:
+                thread.join()
+            self._results.put(_NO_RESULT._replace(error=error))
+
+    def _decode(self, decoder):
+        while self.pacer.wait(self._stop_event):
+            # Image prise après l'attente: la plus récente au moment du décodage
+            item = self.frames.get()
+            if item is None:
+                if self.frames.closed:
+                    break
+                continue
+            sequence, frame = item
+            cpu_start = time.thread_time()
+            try:
+                symbols = decoder.decode(frame, self.min_symbols)
+            except Exception as e:
+                Logger.error(f"SCANNER: Erreur inattendue pendant le décodage: {e}")
+                continue
+            finally:
+                self.pacer.add_cpu(time.thread_time() - cpu_start)
+            self.pacer.update(decoder.last_quality)
+            if symbols and not self._stop_event.is_set():
+                self._results.put(DecodeResult(symbols, None, sequence, decoder.last_stage, decoder.last_latency_ms))
+
+    def next_result(self, timeout=WAIT_INTERVAL):
+        """
+        Attend les QR d'une image décodée. Retourne un DecodeResult: symbols renseigné, ou error
+        (erreur de la source, qui arrête la capture; frame_sources.END_OF_SOURCE à la fin d'un
+        enregistrement), ou aucun des deux si rien avant timeout.
+        """
+        try:
+            return self._results.get(timeout=timeout)
+        except queue.Empty:
+            return _NO_RESULT
+
+    def stats(self):
+        """
+        Images capturées, abandonnées (remplacées par une plus récente), analysées, ignorées
+        (sombres/floues), décodées; latence moyenne (ms); temps CPU du décodage, de la capture
+        et durée du scan (s).
+        """
+        frames = sum(decoder.frames for decoder in self._decoders)
+        total_latency_ms = sum(decoder.total_latency_ms for decoder in self._decoders)
+        return {
+            'captured': self.captured,
+            'dropped': self.frames.dropped,
+            'frames': frames,
+            'skipped_frames': sum(decoder.skipped_frames for decoder in self._decoders),
+            'decoded_frames': sum(decoder.decoded_frames for decoder in self._decoders),
+            'mean_latency_ms': total_latency_ms / frames if frames else 0.0,
+            'workers': self.workers,
+            'cpu_seconds': self.pacer.cpu_seconds,
+            'capture_cpu_seconds': self.pacer.capture_cpu_seconds,
+            'elapsed_seconds': self.pacer.elapsed(),
+        }
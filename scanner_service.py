@@ -0,0 +1,122 @@
+# scanner_service.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from kivy.clock import Clock
+from kivy.logger import Logger # Importer Logger
+
+import qr_scanner
+
+class ScanFuture(Future):
+    """
+    Future d'un scan exécuté par le ScannerService.
+    cancel() retire le scan de la file s'il n'a pas démarré, ou arrête la boucle de capture
+    en cours (à la prochaine image); dans les deux cas le callback n'est jamais appelé.
+    """
+
+    def __init__(self, scan_func, callback, timeout=None):
+        super().__init__()
+        self.scan_func = scan_func # scan_func(cancel_event) -> (résultat, erreur), bloquant
+        self.callback = callback
+        self.timeout = timeout
+        self.cancel_event = threading.Event()
+        self.started_at = None # time.monotonic() au début de la capture
+
+    def cancel(self):
+        self.cancel_event.set()
+        return super().cancel()
+
+    def elapsed(self):
+        """Secondes écoulées depuis le début de la capture (0 si pas encore démarrée)."""
+        return time.monotonic() - self.started_at if self.started_at is not None else 0
+
+class ScannerService:
+    """
+    Thread dédié à la capture et au décodage des QR codes: l'UI Kivy reste fluide pendant
+    un scan. scan() retourne immédiatement un ScanFuture et le callback(qr_data, error)
+    est appelé sur le thread UI via Clock. Un seul scan est exécuté à la fois.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._current = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='ScannerService', daemon=True)
+            self._thread.start()
+            Logger.info("SCANNER: Service de scan démarré.")
+
+    def stop(self, timeout=5):
+        """Annule le scan en cours et ceux en file, puis arrête le thread."""
+        # Vider la file d'abord: un scan en attente ne doit pas démarrer avant l'arrêt
+        while True:
+            try:
+                future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if future is not None:
+                future.cancel()
+        if self._current is not None:
+            self._current.cancel()
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+            Logger.info("SCANNER: Service de scan arrêté.")
+        self._thread = None
+
+    def scan(self, callback, timeout=qr_scanner.SCAN_TIMEOUT, pair=False):
+        """
+        Met un scan en file. callback(qr_data, error) est appelé sur le thread UI, sauf si le scan est annulé.
+        pair=True: qr_data est (QR produit, ID emplacement), voir qr_scanner.scan_qr_windows.
+        """
+        future = ScanFuture(lambda cancel_event: qr_scanner.scan_qr_code(timeout, cancel_event, pair), callback, timeout)
+        self._queue.put(future)
+        return future
+
+    def scan_continuous(self, on_payload, callback, dedup_window=qr_scanner.DEDUP_WINDOW,
+                        idle_timeout=qr_scanner.CONTINUOUS_IDLE_TIMEOUT):
+        """
+        Met en file un scan continu (voir qr_scanner.scan_qr_continuous). on_payload(contenu) est
+        appelé sur le thread UI pour chaque nouveau QR code, callback(nombre, error) quand le scan
+        s'arrête de lui-même. cancel() termine le scan; ni on_payload ni callback ne sont alors appelés.
+        """
+        future = None
+
+        def deliver_payload(payload):
+            # Appelé sur le thread de capture: repasser sur le thread UI
+            Clock.schedule_once(lambda dt: None if future.cancel_event.is_set() else on_payload(payload))
+
+        future = ScanFuture(lambda cancel_event: qr_scanner.scan_qr_continuous(
+            deliver_payload, cancel_event, dedup_window, idle_timeout), callback)
+        self._queue.put(future)
+        return future
+
+    def _run(self):
+        while True:
+            future = self._queue.get()
+            if future is None:
+                break
+            if future.cancel_event.is_set() or not future.set_running_or_notify_cancel():
+                continue # Annulé avant de démarrer
+            self._current = future
+            future.started_at = time.monotonic()
+            try:
+                result = future.scan_func(future.cancel_event)
+            except Exception as e:
+                Logger.error(f"SCANNER: Erreur inattendue pendant le scan: {e}")
+                result = (None, f"Erreur inattendue: {e}")
+            finally:
+                self._current = None
+            future.set_result(result)
+            if not future.cancel_event.is_set():
+                Clock.schedule_once(lambda dt, future=future: self._deliver(future))
+
+    def _deliver(self, future):
+        # Une annulation demandée entre la fin du scan et ce callback l'emporte
+        if future.cancel_event.is_set():
+            return
+        result, error = future.result()
+        future.callback(result, error)